@@ -0,0 +1,284 @@
+"""Drive a mixed API workload and report per-endpoint latency percentiles and throughput as JSON.
+
+Seeds --users users (country codes taken from tests/init-database.sh), --friends
+friendships and --posts posts through the API, then runs --concurrency workers for
+--duration seconds, each picking operations at random by the --mix weights. Runs
+in-process against solution.app by default (combine with STORAGE_ENGINE=memory to
+take the database out of the picture) or against a running server with --url.
+The register operation also signs the new user in so later operations can use it.
+Like/dislike are counted as skipped while there is no post to react to.
+Seeding is planned serially from --seed, so the same --seed seeds the same users,
+friendships and posts. Logins carry a --run prefix (defaults to --seed); pass a new
+--run to repeat a run against a database that already has its users.
+
+    python -m benchmarks.load_test --users 200 --concurrency 16 --duration 30 --output baseline.json
+    python -m benchmarks.load_test --url http://localhost:8080 --mix sign-in=1,feed:home=4
+"""
+import argparse
+import itertools
+import json
+import os
+import random
+import sys
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+import httpx
+
+from solution.memory import load_seed_countries
+
+PASSWORD = 'Qwerty1337'
+DEFAULT_MIX = ('register=1,sign-in=2,profile:get=10,profile:patch=2,profile:other=5,friends:add=3,friends:list=5,'
+               'feed:my=5,feed:other=10,feed:home=15,posts:new=5,posts:like=8,posts:dislike=2')
+
+
+def parse_mix(value: str) -> dict:
+    mix = {}
+    for item in value.split(','):
+        name, _, weight = item.partition('=')
+        if name not in OPERATIONS:
+            raise argparse.ArgumentTypeError(f'unknown operation {name!r}, expected one of {", ".join(OPERATIONS)}')
+        mix[name] = float(weight or 1)
+    return mix
+
+
+class State:
+    def __init__(self, run: int, countries: list):
+        self.run = run
+        self.countries = [country['alpha2'] for country in countries]
+        self.ids = itertools.count(1)
+        self.users = []
+        self.post_ids = []
+
+    def new_user(self, rnd: random.Random) -> dict:
+        number = next(self.ids)
+        login = f'lt{self.run}-{number}'
+        return {'login': login, 'email': f'{login}@example.com', 'password': PASSWORD,
+                'countryCode': rnd.choice(self.countries), 'isPublic': True, 'phone': f'+9{self.run:08d}{number:06d}'}
+
+    def headers(self, rnd: random.Random) -> dict:
+        return bearer(rnd.choice(self.users))
+
+
+def bearer(user: tuple) -> dict:
+    return {'Authorization': f'Bearer {user[1]}'}
+
+
+def post_body(rnd: random.Random) -> dict:
+    return {'content': f'post {uuid.UUID(int=rnd.getrandbits(128))}',
+            'tags': rnd.sample(['invest', 'stocks', 'bonds', 'crypto', 'news'], 2)}
+
+
+def sign_up(client, user: dict) -> tuple:
+    response = client.post('/api/auth/register', json=user)
+    token = None
+    if response.status_code == 201:
+        token = client.post('/api/auth/sign-in', json={'login': user['login'], 'password': PASSWORD}).json()['token']
+    return response, token
+
+
+def register(client, state: State, rnd: random.Random):
+    user = state.new_user(rnd)
+    response, token = sign_up(client, user)
+    if token is not None:
+        state.users.append((user['login'], token))
+    return response
+
+
+def sign_in(client, state: State, rnd: random.Random):
+    return client.post('/api/auth/sign-in', json={'login': rnd.choice(state.users)[0], 'password': PASSWORD})
+
+
+def get_profile(client, state: State, rnd: random.Random):
+    return client.get('/api/me/profile', headers=state.headers(rnd))
+
+
+def patch_profile(client, state: State, rnd: random.Random):
+    return client.patch('/api/me/profile', headers=state.headers(rnd),
+                        json={'isPublic': True, 'image': f'https://http.cat/images/{rnd.randrange(100, 600)}.jpg'})
+
+
+def get_other_profile(client, state: State, rnd: random.Random):
+    return client.get(f'/api/profiles/{rnd.choice(state.users)[0]}', headers=state.headers(rnd))
+
+
+def add_friend(client, state: State, rnd: random.Random):
+    return client.post('/api/friends/add', json={'login': rnd.choice(state.users)[0]}, headers=state.headers(rnd))
+
+
+def list_friends(client, state: State, rnd: random.Random):
+    return client.get('/api/friends', params={'limit': 10}, headers=state.headers(rnd))
+
+
+def my_feed(client, state: State, rnd: random.Random):
+    return client.get('/api/posts/feed/my', params={'limit': 10}, headers=state.headers(rnd))
+
+
+def other_feed(client, state: State, rnd: random.Random):
+    return client.get(f'/api/posts/feed/{rnd.choice(state.users)[0]}', params={'limit': 10},
+                      headers=state.headers(rnd))
+
+
+def home_feed(client, state: State, rnd: random.Random):
+    return client.get('/api/timeline/home', params={'limit': 10}, headers=state.headers(rnd))
+
+
+def new_post(client, state: State, rnd: random.Random):
+    response = client.post('/api/posts/new', headers=state.headers(rnd), json=post_body(rnd))
+    if response.status_code == 200:
+        state.post_ids.append(response.json()['id'])
+    return response
+
+
+def like(client, state: State, rnd: random.Random):
+    if not state.post_ids:
+        return None
+    return client.post(f'/api/posts/{rnd.choice(state.post_ids)}/like', headers=state.headers(rnd))
+
+
+def dislike(client, state: State, rnd: random.Random):
+    if not state.post_ids:
+        return None
+    return client.post(f'/api/posts/{rnd.choice(state.post_ids)}/dislike', headers=state.headers(rnd))
+
+
+OPERATIONS = {
+    'register': register,
+    'sign-in': sign_in,
+    'profile:get': get_profile,
+    'profile:patch': patch_profile,
+    'profile:other': get_other_profile,
+    'friends:add': add_friend,
+    'friends:list': list_friends,
+    'feed:my': my_feed,
+    'feed:other': other_feed,
+    'feed:home': home_feed,
+    'posts:new': new_post,
+    'posts:like': like,
+    'posts:dislike': dislike
+}
+
+
+@contextmanager
+def make_client(url: str | None):
+    if url:
+        with httpx.Client(base_url=url, timeout=30) as client:
+            yield client
+        return
+    from fastapi.testclient import TestClient
+    from solution.app import app
+    with TestClient(app, raise_server_exceptions=False) as client:
+        yield client
+
+
+def seed(client, state: State, args, rnd: random.Random) -> dict:
+    started = time.perf_counter()
+    users = [state.new_user(rnd) for _ in range(args.users)]
+    with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+        tokens = executor.map(lambda user: sign_up(client, user)[1], users)
+        state.users.extend((user['login'], token) for user, token in zip(users, tokens) if token is not None)
+        if not state.users:
+            raise SystemExit('seeding failed: no user could register')
+        friends = [(rnd.choice(state.users), rnd.choice(state.users)[0]) for _ in range(args.friends)]
+        list(executor.map(lambda pair: client.post('/api/friends/add', json={'login': pair[1]},
+                                                   headers=bearer(pair[0])), friends))
+        posts = [(rnd.choice(state.users), post_body(rnd)) for _ in range(args.posts)]
+        responses = executor.map(lambda post: client.post('/api/posts/new', json=post[1], headers=bearer(post[0])),
+                                 posts)
+        state.post_ids.extend(response.json()['id'] for response in responses if response.status_code == 200)
+    return {'users': len(state.users), 'friends': args.friends, 'posts': len(state.post_ids),
+            'seconds': round(time.perf_counter() - started, 3)}
+
+
+def work(client, state: State, mix: dict, deadline: float, rnd: random.Random) -> list:
+    names, weights = list(mix), list(mix.values())
+    samples = []
+    while time.perf_counter() < deadline:
+        name = rnd.choices(names, weights)[0]
+        started = time.perf_counter()
+        try:
+            response = OPERATIONS[name](client, state, rnd)
+        except httpx.HTTPError:
+            samples.append((name, time.perf_counter() - started, 0))
+            continue
+        if response is None:
+            samples.append((name, None, None))
+        else:
+            samples.append((name, time.perf_counter() - started, response.status_code))
+    return samples
+
+
+def percentile(latencies: list, q: float) -> float:
+    return latencies[min(len(latencies) - 1, max(0, round(q * len(latencies)) - 1))]
+
+
+def summarize(samples: list, duration: float) -> dict:
+    latencies = sorted(latency for _, latency, _ in samples if latency is not None)
+    errors = sum(1 for _, _, status in samples if status is not None and not 200 <= status < 400)
+    skipped = len(samples) - len(latencies)
+    if not latencies:
+        return {'requests': 0, 'errors': 0, 'skipped': skipped, 'throughput': 0.0}
+    return {
+        'requests': len(latencies),
+        'errors': errors,
+        'skipped': skipped,
+        'throughput': round(len(latencies) / duration, 2),
+        'mean_ms': round(sum(latencies) / len(latencies) * 1000, 3),
+        'p50_ms': round(percentile(latencies, 0.50) * 1000, 3),
+        'p95_ms': round(percentile(latencies, 0.95) * 1000, 3),
+        'p99_ms': round(percentile(latencies, 0.99) * 1000, 3),
+        'max_ms': round(latencies[-1] * 1000, 3)
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--url', help='base URL of a running server; the app is run in-process when omitted')
+    parser.add_argument('--users', type=int, default=200)
+    parser.add_argument('--friends', type=int, default=1000)
+    parser.add_argument('--posts', type=int, default=1000)
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--duration', type=float, default=30.0)
+    parser.add_argument('--mix', type=parse_mix, default=DEFAULT_MIX)
+    parser.add_argument('--seed', type=int, default=59)
+    parser.add_argument('--run', type=int, help='login prefix, defaults to --seed')
+    parser.add_argument('--output', help='write the JSON report to this file instead of stdout')
+    args = parser.parse_args()
+
+    rnd = random.Random(args.seed)
+    countries = load_seed_countries()
+    state = State((args.seed if args.run is None else args.run) % 10 ** 8, countries)
+    with make_client(args.url) as client:
+        seeded = seed(client, state, args, rnd)
+        deadline = time.perf_counter() + args.duration
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+            futures = [executor.submit(work, client, state, args.mix, deadline, random.Random(args.seed + i))
+                       for i in range(args.concurrency)]
+            samples = [sample for future in futures for sample in future.result()]
+        duration = time.perf_counter() - started
+
+    by_operation = {}
+    for sample in samples:
+        by_operation.setdefault(sample[0], []).append(sample)
+    report = {
+        'target': args.url or f'in-process ({os.environ.get("STORAGE_ENGINE", "postgres")})',
+        'config': {'concurrency': args.concurrency, 'duration': args.duration, 'mix': args.mix, 'seed': args.seed,
+                   'run': state.run},
+        'seed': seeded,
+        'duration': round(duration, 3),
+        'total': summarize(samples, duration),
+        'endpoints': {name: summarize(by_operation[name], duration) for name in sorted(by_operation)}
+    }
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+
+
+if __name__ == '__main__':
+    main()
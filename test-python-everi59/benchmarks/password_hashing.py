@@ -0,0 +1,66 @@
+"""Measure password hashing throughput per scheme to tune PASSWORD_HASH_* settings.
+
+Prints hashes/second and verifies/second for every scheme (and every requested
+rounds value for schemes that support them), single-threaded and with the given
+number of worker threads. Rounds outside a scheme's valid range are skipped
+(bcrypt takes a log2 cost, e.g. --rounds 10 12).
+
+    python -m benchmarks.password_hashing --rounds 10 12 5000 10000 50000 --workers 4
+"""
+import argparse
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from passlib.registry import get_crypt_handler
+
+from solution.service import make_crypt_context
+
+PASSWORD = 'Qwerty1337'
+
+
+def measure(func, arg, seconds: float, workers: int) -> float:
+    done = 0
+    deadline = time.perf_counter() + seconds
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        while time.perf_counter() < deadline:
+            list(executor.map(func, [arg] * workers))
+            done += workers
+    return done / (time.perf_counter() - started)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--schemes', nargs='+', default=['sha256_crypt', 'md5_crypt', 'des_crypt',
+                                                         'pbkdf2_sha256', 'bcrypt'])
+    parser.add_argument('--rounds', nargs='+', type=int, default=[10, 12, 5000, 10000, 50000])
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--seconds', type=float, default=1.0)
+    args = parser.parse_args()
+
+    print(f'{"scheme":<16}{"rounds":>10}{"hash/s":>12}{"verify/s":>12}{"hash/s x" + str(args.workers):>14}')
+    for scheme in args.schemes:
+        try:
+            handler = get_crypt_handler(scheme)
+        except KeyError:
+            print(f'{scheme:<16} unknown scheme')
+            continue
+        rounds_options = [None]
+        if 'rounds' in handler.setting_kwds:
+            rounds_options = [rounds for rounds in args.rounds if handler.min_rounds <= rounds <= handler.max_rounds]
+            rounds_options = rounds_options or [handler.default_rounds]
+        for rounds in rounds_options:
+            try:
+                context = make_crypt_context([scheme], scheme, rounds)
+                hashed = context.hash(PASSWORD)
+            except Exception as e:
+                print(f'{scheme:<16}{str(rounds):>10}  {e}')
+                continue
+            hash_rate = measure(context.hash, PASSWORD, args.seconds, 1)
+            verify_rate = measure(lambda plain: context.verify(plain, hashed), PASSWORD, args.seconds, 1)
+            parallel_rate = measure(context.hash, PASSWORD, args.seconds, args.workers)
+            print(f'{scheme:<16}{str(rounds or "-"):>10}{hash_rate:>12.1f}{verify_rate:>12.1f}{parallel_rate:>14.1f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,68 @@
+"""Measure the per-row cost of decoding post tags for a feed page.
+
+Compares the legacy scheme (tags stored as a hand-built '["a", "b"]' string and
+decoded with eval) with JSON and with the native TEXT[] column the posts table
+uses now, decoded by psycopg2's array typecaster. Every scheme decodes the same
+synthetic feed pages; tags include quotes, commas and braces, which the legacy
+encoding cannot round-trip at all.
+
+    python -m benchmarks.tag_decoding --rows 50 --tags 5 --pages 2000
+"""
+import argparse
+import json
+import random
+import time
+
+from psycopg2.extensions import STRINGARRAY
+
+ALPHABET = 'abcdefghijklmnopqrstuvwxyz0123456789 ,"{}\\'
+
+
+def legacy_encode(tags: list) -> str:
+    return '[' + ', '.join(f'"{tag}"' for tag in tags) + ']'
+
+
+def array_encode(tags: list) -> str:
+    return '{' + ','.join('"' + tag.replace('\\', '\\\\').replace('"', '\\"') + '"' for tag in tags) + '}'
+
+
+SCHEMES = {
+    'eval (legacy)': (legacy_encode, eval),
+    'json': (lambda tags: json.dumps(tags, ensure_ascii=False), json.loads),
+    'text[] (psycopg2)': (array_encode, lambda value: STRINGARRAY(value, None))
+}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rows', type=int, default=50)
+    parser.add_argument('--tags', type=int, default=5)
+    parser.add_argument('--pages', type=int, default=2000)
+    parser.add_argument('--seed', type=int, default=59)
+    args = parser.parse_args()
+
+    rnd = random.Random(args.seed)
+    page = [[''.join(rnd.choice(ALPHABET) for _ in range(rnd.randint(1, 20))) for _ in range(args.tags)]
+            for _ in range(args.rows)]
+
+    print(f'{"scheme":<20}{"us/row":>10}{"ms/page":>10}{"round-trip":>12}')
+    for name, (encode, decode) in SCHEMES.items():
+        encoded = [encode(tags) for tags in page]
+        try:
+            exact = [decode(value) for value in encoded] == page
+        except Exception:
+            exact = False
+        started = time.perf_counter()
+        for _ in range(args.pages):
+            for value in encoded:
+                try:
+                    decode(value)
+                except Exception:
+                    pass
+        elapsed = time.perf_counter() - started
+        per_row = elapsed / (args.pages * args.rows) * 1e6
+        print(f'{name:<20}{per_row:>10.2f}{elapsed / args.pages * 1e3:>10.3f}{"exact" if exact else "broken":>12}')
+
+
+if __name__ == '__main__':
+    main()
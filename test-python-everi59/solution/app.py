@@ -1,50 +1,150 @@
 # -.- encoding:utf-8 -.-
+import logging
 import re
+import time
 import uuid
 
+from anyio import to_thread
+from contextlib import asynccontextmanager
 from datetime import datetime
 from string import ascii_lowercase, ascii_uppercase
 from typing import Optional, Annotated
-from fastapi import FastAPI, Header
+from fastapi import FastAPI, Header, Query
 from fastapi.exceptions import RequestValidationError
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, Response
 from fastapi.security import OAuth2PasswordBearer
 from starlette import status
 
-from .database import (get_countries, get_country, check_user, check_country_code,
+from .config import load_concurrency_configs, load_countries_configs, load_http_cache_configs, load_counter_configs
+from .counters import CounterBuffer
+from .countries import CountryCatalog
+from .metrics import MetricsMiddleware, metrics
+from .storage import (init_database, close_database, pool_stats, get_countries, check_user,
                       register_user,
-                      get_user_from_db, get_user_profile_from_db, update_user_profile, check_user_for_update,
-                      get_user_hashed_password, get_friends_from_database,
-                      add_friend_to_database, remove_friend_from_database, insert_new_post,
-                      get_post_from_db, get_feed_by_author, get_reaction,
-                      update_reaction, insert_reaction, update_posts_counts)
+                      get_user_from_db, update_user_profile, update_user_password,
+                      check_user_for_update,
+                      insert_new_post,
+                      get_post_from_db, get_feed_page, get_friends_page, get_home_timeline, search_posts_by_tag,
+                      search_posts_by_text, get_trending_tags, react_to_post, record_reaction,
+                      apply_counter_deltas, storage)
+from .pagination import encode_cursor, decode_cursor
 from .models import Region, UserReg, FormData, UserUpdatedProfile, UpdatePassword, AddFriend, RemoveFriend, \
     NewPost
-from .service import verify_password, get_password_hash, authenticate_user, create_token, token_data_validation
-
-app = FastAPI()
+from .policy import VisibilityPolicy
+from .profiler import ProfilerMiddleware, profiler
+from .records import StorageUnavailable, reaction_delta
+from .service import verify_password, get_password_hash, authenticate_user, create_token, token_data_validation, \
+    token_user_validation, forget_user, add_friend, remove_friend
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    started = time.monotonic()
+    threadpool_size = load_concurrency_configs()['threadpool_size']
+    to_thread.current_default_thread_limiter().total_tokens = threadpool_size
+    report = await init_database()
+    await country_catalog.load()
+    country_catalog.start_refresh()
+    reaction_counters.start()
+    profiler.start()
+    logger = logging.getLogger(__name__)
+    logger.info(
+        'Приложение запущено за %.3f с: БД готова за %.3f с (попыток: %d), версия схемы %d, применены миграции: %s',
+        time.monotonic() - started, report['seconds'], report['attempts'], report['schema_version'],
+        report['applied'] or 'нет')
+    stats = pool_stats()
+    if stats is not None and not getattr(storage, 'offload', False):
+        logger.info('Одновременно к БД обращаются не более %d запросов (POSTGRES_POOL_MAX_SIZE=%d)',
+                    stats['max_size'], stats['max_size'])
+    elif stats is not None:
+        logger.info('Одновременно к БД обращаются не более %d запросов (THREADPOOL_SIZE=%d, POSTGRES_POOL_MAX_SIZE=%d)',
+                    min(threadpool_size, stats['max_size']), threadpool_size, stats['max_size'])
+    yield
+    profiler.stop()
+    await country_catalog.stop_refresh()
+    await reaction_counters.stop()
+    await close_database()
+
+
+country_catalog = CountryCatalog(get_countries, **load_countries_configs())
+reaction_counters = CounterBuffer(apply_counter_deltas, **load_counter_configs())
+http_cache_settings = load_http_cache_configs()
+app = FastAPI(lifespan=lifespan)
+if metrics.enabled:
+    app.add_middleware(MetricsMiddleware, metrics=metrics)
+if profiler.enabled:
+    app.add_middleware(ProfilerMiddleware, profiler=profiler)
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/api/auth/sign-in")
 
 
 @app.get('/api/ping')
-def send():
+async def send():
     return {"status": "ok"}
 
 
+@app.get('/metrics')
+async def send_metrics():
+    if not metrics.enabled:
+        return JSONResponse(
+            status_code=status.HTTP_404_NOT_FOUND,
+            content={'reason': 'Метрики отключены!'}
+        )
+    return Response(content=metrics.render(pool_stats()),
+                    media_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+@app.get('/debug/profiler')
+async def send_profiler_report(reset: bool = False):
+    if not profiler.enabled:
+        return JSONResponse(
+            status_code=status.HTTP_404_NOT_FOUND,
+            content={'reason': 'Профилировщик отключён!'}
+        )
+    report = profiler.report()
+    if reset:
+        profiler.reset()
+    return {'maxQueries': profiler.max_queries, 'repeatedQueries': profiler.repeated_queries,
+            'slowMs': profiler.slow_ms, 'routes': report}
+
+
+def etag_matches(if_none_match: str | None, etag: str) -> bool:
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == '*':
+        return True
+    return etag in (i.strip().removeprefix('W/') for i in if_none_match.split(','))
+
+
+def cached_json_response(body: bytes, etag: str, if_none_match: str | None, max_age: int):
+    headers = {'ETag': etag, 'Cache-Control': f'public, max-age={max_age}'}
+    if etag_matches(if_none_match, etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    return Response(content=body, media_type='application/json', headers=headers)
+
+
 @app.get('/api/countries')
-def countries(region: Optional[Region] = None):
-    return get_countries(region=region)
+async def countries(region: Annotated[Optional[list[Region]], Query()] = None,
+                    if_none_match: Annotated[str | None, Header()] = None):
+    body, etag = country_catalog.list_body([i.value for i in region or ()])
+    return cached_json_response(body, etag, if_none_match, http_cache_settings['countries_max_age'])
 
 
 @app.get('/api/countries/{alpha2}')
-def country(alpha2: str):
-    return get_country(alpha2=alpha2.upper())
+async def country(alpha2: str, if_none_match: Annotated[str | None, Header()] = None):
+    cached = country_catalog.get_body(alpha2.upper())
+    if cached is None:
+        return JSONResponse(
+            status_code=status.HTTP_404_NOT_FOUND,
+            content={'reason': 'Страна с указанным кодом не найдена!'}
+        )
+    body, etag = cached
+    return cached_json_response(body, etag, if_none_match, http_cache_settings['countries_max_age'])
 
 
 @app.post('/api/auth/register')
-def register(user_data: UserReg):
+async def register(user_data: UserReg):
     error = None
-    check_user_exists = check_user(
+    check_user_exists = await check_user(
         user_data.login,
         user_data.email,
         user_data.phone
@@ -53,7 +153,7 @@ def register(user_data: UserReg):
         return JSONResponse(
             status_code=status.HTTP_409_CONFLICT,
             content={
-                'reason': 'Юзер с таким email/login/phone уже существует!'
+                'reason': f'Юзер с таким {check_user_exists} уже существует!'
             }
         )
     if not re.fullmatch(r'[a-zA-Z0-9-]{1,30}', user_data.login):
@@ -67,7 +167,7 @@ def register(user_data: UserReg):
             or not any(i in '0123456789' for i in user_data.password)
     ):
         error = 'Вы ввели некорректный пароль!'
-    elif not check_country_code(user_data.countryCode):
+    elif not country_catalog.contains(user_data.countryCode):
         error = 'Вы ввели некорректный код страны'
     elif user_data.phone:
         if not re.fullmatch(r'\+\d+', user_data.phone):
@@ -83,13 +183,13 @@ def register(user_data: UserReg):
             }
         )
     else:
-        register_user(
+        await register_user(
             email=user_data.email,
             login=user_data.login,
             phone=user_data.phone,
             countryCode=user_data.countryCode,
             isPublic=user_data.isPublic,
-            hashed_password=get_password_hash(user_data.password),
+            hashed_password=await get_password_hash(user_data.password),
             image=user_data.image
         )
         result = {
@@ -108,29 +208,29 @@ def register(user_data: UserReg):
 
 @app.post('/api/auth/sign-in')
 async def user_sign_in(form_data: FormData):
-    user_dict = get_user_from_db(login=form_data.login)
-    user_auth = authenticate_user(password=form_data.password, user_dict=user_dict)
+    user = await get_user_from_db(login=form_data.login)
+    user_auth = await authenticate_user(password=form_data.password, user=user)
     if isinstance(user_auth, JSONResponse):
         return user_auth
-    token = create_token(form_data.login, form_data.password)
+    token = create_token(user_auth.login, user_auth.tokenVersion)
     return {'token': token}
 
 
 @app.get('/api/me/profile')
-def get_user_profile(authorization: Annotated[str | None, Header()]):
-    user_json = token_data_validation(authorization=authorization)
+async def get_user_profile(authorization: Annotated[str | None, Header()]):
+    user_json = await token_data_validation(authorization=authorization)
     if isinstance(user_json, JSONResponse):
         return user_json
     return user_json
 
 
 @app.patch('/api/me/profile')
-def get_user_profile(authorization: Annotated[str | None, Header()], user_updated_profile: UserUpdatedProfile):
-    user_json = token_data_validation(authorization=authorization)
+async def get_user_profile(authorization: Annotated[str | None, Header()], user_updated_profile: UserUpdatedProfile):
+    user_json = await token_data_validation(authorization=authorization)
     if isinstance(user_json, JSONResponse):
         return user_json
     error = False
-    check_user_exists = check_user_for_update(
+    check_user_exists = await check_user_for_update(
         user_json['login'],
         user_updated_profile.phone
     )
@@ -142,7 +242,7 @@ def get_user_profile(authorization: Annotated[str | None, Header()], user_update
             }
         )
     if user_updated_profile.countryCode:
-        if not check_country_code(user_updated_profile.countryCode):
+        if not country_catalog.contains(user_updated_profile.countryCode):
             error = 'Вы ввели некорректный код страны'
         else:
             user_json['countryCode'] = user_updated_profile.countryCode
@@ -168,28 +268,25 @@ def get_user_profile(authorization: Annotated[str | None, Header()], user_update
                 }
         )
     else:
-        update_user_profile(**user_json)
+        await update_user_profile(**user_json)
+        forget_user(user_json['login'])
         return JSONResponse(status_code=status.HTTP_200_OK,
                             content=user_json)
 
 
 @app.get('/api/profiles/{login_to_get}')
-def send_profile(login_to_get: str, authorization: Annotated[str | None, Header()]):
-    user_json = token_data_validation(authorization=authorization)
+async def send_profile(login_to_get: str, authorization: Annotated[str | None, Header()]):
+    user_json = await token_data_validation(authorization=authorization)
     if isinstance(user_json, JSONResponse):
         return user_json
-    user_to_get_json = get_user_profile_from_db(login=login_to_get)
-    if user_to_get_json is None:
+    user_to_get = await get_user_from_db(login=login_to_get)
+    if user_to_get is None:
         return JSONResponse(
             status_code=status.HTTP_403_FORBIDDEN,
             content={'reason': 'Данного пользователя не нашлось!'}
         )
-    if user_json['login'] == login_to_get:
-        return user_to_get_json
-    elif user_to_get_json['isPublic'] is True:
-        return user_to_get_json
-    elif user_json['login'] in get_friends_from_database(friend_from_login=login_to_get):
-        return user_to_get_json
+    if await VisibilityPolicy(user_json['login']).can_view(login_to_get, is_public=user_to_get.isPublic):
+        return user_to_get.profile()
     else:
         return JSONResponse(
             status_code=status.HTTP_403_FORBIDDEN,
@@ -198,12 +295,11 @@ def send_profile(login_to_get: str, authorization: Annotated[str | None, Header(
 
 
 @app.post('/api/me/updatePassword')
-def updating_password(update_password: UpdatePassword, authorization: Annotated[str | None, Header()]):
-    user_json = token_data_validation(authorization=authorization)
-    if isinstance(user_json, JSONResponse):
-        return user_json
-    user_hashed_password = get_user_hashed_password(user_json['login'])
-    if not verify_password(update_password.oldPassword, user_hashed_password):
+async def updating_password(update_password: UpdatePassword, authorization: Annotated[str | None, Header()]):
+    user = await token_user_validation(authorization=authorization)
+    if isinstance(user, JSONResponse):
+        return user
+    if not await verify_password(update_password.oldPassword, user.hashed_password):
         return JSONResponse(status_code=status.HTTP_403_FORBIDDEN,
                             content={'reason': 'Старый пароль не совпадает!'})
     else:
@@ -216,28 +312,28 @@ def updating_password(update_password: UpdatePassword, authorization: Annotated[
             return JSONResponse(status_code=status.HTTP_400_BAD_REQUEST,
                                 content={'reason': 'Вы ввели некорректный пароль!'})
         else:
-            update_user_profile(login=user_json['login'],
-                                hashed_password=get_password_hash(update_password.newPassword))
+            hashed_password = await get_password_hash(update_password.newPassword)
+            await update_user_password(login=user.login, hashed_password=hashed_password)
+            forget_user(user.login)
             return JSONResponse(status_code=status.HTTP_200_OK,
                                 content={'status': 'ok'})
 
 
 @app.post('/api/friends/add')
-def adding_friend(add_friend: AddFriend, authorization: Annotated[str | None, Header()]):
-    user_json = token_data_validation(authorization=authorization)
+async def adding_friend(new_friend: AddFriend, authorization: Annotated[str | None, Header()]):
+    user_json = await token_data_validation(authorization=authorization)
     if isinstance(user_json, JSONResponse):
         return user_json
-    friends = get_friends_from_database(friend_from_login=user_json['login'])
-    if add_friend.login in friends or user_json['login'] == add_friend.login:
+    if user_json['login'] == new_friend.login:
         return JSONResponse(
             status_code=status.HTTP_200_OK,
             content={"status": "ok"}
         )
     else:
-        friend_to_json = get_user_profile_from_db(login=add_friend.login)
-        if friend_to_json:
-            add_friend_to_database(friend_from_login=user_json['login'], friend_to_login=friend_to_json['login'],
-                                   addedAt=datetime.now().strftime('%Y-%m-%dT%H:%M:%SZ'))
+        friend_to = await get_user_from_db(login=new_friend.login)
+        if friend_to:
+            await add_friend(friend_from_login=user_json['login'], friend_to_login=friend_to.login,
+                       addedAt=datetime.now().strftime('%Y-%m-%dT%H:%M:%SZ'))
             return JSONResponse(
                 status_code=status.HTTP_200_OK,
                 content={"status": "ok"}
@@ -250,24 +346,18 @@ def adding_friend(add_friend: AddFriend, authorization: Annotated[str | None, He
 
 
 @app.post('/api/friends/remove')
-def removing_friend(remove_friend: RemoveFriend, authorization: Annotated[str | None, Header()]):
-    user_json = token_data_validation(authorization=authorization)
+async def removing_friend(old_friend: RemoveFriend, authorization: Annotated[str | None, Header()]):
+    user_json = await token_data_validation(authorization=authorization)
     if isinstance(user_json, JSONResponse):
         return user_json
-    friends = get_friends_from_database(friend_from_login=user_json['login'])
-    if remove_friend.login in friends:
-        remove_friend_from_database(friend_from_login=user_json['login'], friend_to_login=remove_friend.login)
+    await remove_friend(friend_from_login=user_json['login'], friend_to_login=old_friend.login)
     return JSONResponse(
         status_code=status.HTTP_200_OK,
         content={'status': 'ok'}
     )
 
 
-@app.get('/api/friends')
-def send_friends(authorization: Annotated[str | None, Header()], offset: int = 0, limit: int = 5):
-    user_json = token_data_validation(authorization=authorization)
-    if isinstance(user_json, JSONResponse):
-        return user_json
+def check_page_params(limit: int, offset: int, cursor: str | None, key_size: int = 2):
     if limit > 50 or limit < 0 or offset < 0:
         return JSONResponse(
             status_code=status.HTTP_400_BAD_REQUEST,
@@ -275,20 +365,45 @@ def send_friends(authorization: Annotated[str | None, Header()], offset: int = 0
                 'reason': 'Некорректный offset или limit!'
             }
         )
-    friends = get_friends_from_database(friend_from_login=user_json['login'], offset=offset, limit=limit)
-    result = []
-    for friend in friends:
-        result.append({'login': friend[0], 'addedAt': friend[1]})
-    result.sort(reverse=True, key=lambda x: x['addedAt'])
+    if cursor is None:
+        return None
+    try:
+        return decode_cursor(cursor, size=key_size)
+    except ValueError:
+        return JSONResponse(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            content={
+                'reason': 'Некорректный cursor!'
+            }
+        )
+
+
+def page_response(items: list, next_key: tuple | None):
+    headers = {'X-Next-Cursor': encode_cursor(next_key)} if next_key else None
     return JSONResponse(
         status_code=status.HTTP_200_OK,
-        content=result
+        content=items,
+        headers=headers
     )
 
 
+@app.get('/api/friends')
+async def send_friends(authorization: Annotated[str | None, Header()], offset: int = 0, limit: int = 5,
+                       cursor: str | None = None):
+    user_json = await token_data_validation(authorization=authorization)
+    if isinstance(user_json, JSONResponse):
+        return user_json
+    after = check_page_params(limit=limit, offset=offset, cursor=cursor)
+    if isinstance(after, JSONResponse):
+        return after
+    friends, next_key = await get_friends_page(friend_from_login=user_json['login'], limit=limit, offset=offset,
+                                               after=after)
+    return page_response(friends, next_key)
+
+
 @app.post('/api/posts/new')
-def create_post(new_post: NewPost, authorization: Annotated[str | None, Header()]):
-    user_json = token_data_validation(authorization=authorization)
+async def create_post(new_post: NewPost, authorization: Annotated[str | None, Header()]):
+    user_json = await token_data_validation(authorization=authorization)
     if isinstance(user_json, JSONResponse):
         return user_json
     if len(new_post.content) > 1000:
@@ -304,8 +419,8 @@ def create_post(new_post: NewPost, authorization: Annotated[str | None, Header()
             )
     post_id = uuid.uuid4()
     post_createdAt = datetime.now().strftime('%Y-%m-%dT%H:%M:%SZ')
-    insert_new_post(post_id=str(post_id), content=new_post.content, tags=new_post.tags, createdAt=post_createdAt,
-                    author=user_json['login'])
+    await insert_new_post(post_id=str(post_id), content=new_post.content, tags=new_post.tags,
+                          createdAt=post_createdAt, author=user_json['login'])
     return JSONResponse(
         status_code=status.HTTP_200_OK,
         content={
@@ -320,16 +435,65 @@ def create_post(new_post: NewPost, authorization: Annotated[str | None, Header()
         )
 
 
+@app.get('/api/posts/search')
+async def search_posts(authorization: Annotated[str | None, Header()], tag: str | None = None, q: str | None = None,
+                       limit: int = 5, cursor: str | None = None):
+    user_json = await token_data_validation(authorization=authorization)
+    if isinstance(user_json, JSONResponse):
+        return user_json
+    if not tag and not q:
+        return JSONResponse(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            content={'reason': 'Укажите tag или q!'}
+        )
+    if tag and len(tag) > 20:
+        return JSONResponse(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            content={'reason': 'Количество символов тега превышает 20!'}
+        )
+    if q and len(q) > 200:
+        return JSONResponse(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            content={'reason': 'Слишком длинный поисковый запрос!'}
+        )
+    after = check_page_params(limit=limit, offset=0, cursor=cursor, key_size=3 if q else 2)
+    if isinstance(after, JSONResponse):
+        return after
+    async with reaction_counters.reading():
+        if q:
+            posts, next_key = await search_posts_by_text(viewer=user_json['login'], q=q, limit=limit, tag=tag,
+                                                         after=after)
+        else:
+            posts, next_key = await search_posts_by_tag(viewer=user_json['login'], tag=tag, limit=limit, after=after)
+        posts = [reaction_counters.merge(post) for post in posts]
+    return page_response(posts, next_key)
+
+
+@app.get('/api/posts/tags/trending')
+async def send_trending_tags(authorization: Annotated[str | None, Header()], limit: int = 10):
+    user_json = await token_data_validation(authorization=authorization)
+    if isinstance(user_json, JSONResponse):
+        return user_json
+    if limit > 50 or limit < 0:
+        return JSONResponse(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            content={'reason': 'Некорректный limit!'}
+        )
+    return JSONResponse(
+        status_code=status.HTTP_200_OK,
+        content=await get_trending_tags(limit=limit)
+    )
+
+
 @app.get('/api/posts/{postId}')
-def send_post_by_id(postId: str, authorization: Annotated[str | None, Header()]):
-    user_json = token_data_validation(authorization=authorization)
+async def send_post_by_id(postId: str, authorization: Annotated[str | None, Header()]):
+    user_json = await token_data_validation(authorization=authorization)
     if isinstance(user_json, JSONResponse):
         return user_json
-    post = get_post_from_db(post_id=postId)
+    async with reaction_counters.reading():
+        post = reaction_counters.merge(await get_post_from_db(post_id=postId))
     if post:
-        author_profile = get_user_profile_from_db(login=post['author'])
-        if post['author'] == user_json['login'] or author_profile['isPublic'] == 'true' or \
-                user_json['login'] in get_friends_from_database(friend_from_login=post['author']):
+        if await VisibilityPolicy(user_json['login']).can_view(post['author']):
             return JSONResponse(status_code=status.HTTP_200_OK,
                                 content=post)
         else:
@@ -341,82 +505,77 @@ def send_post_by_id(postId: str, authorization: Annotated[str | None, Header()])
 
 
 @app.get('/api/posts/feed/my')
-def get_my_feed(authorization: Annotated[str | None, Header()], limit: int = 5, offset: int = 0):
-    user_json = token_data_validation(authorization=authorization)
+async def get_my_feed(authorization: Annotated[str | None, Header()], limit: int = 5, offset: int = 0,
+                      cursor: str | None = None):
+    user_json = await token_data_validation(authorization=authorization)
     if isinstance(user_json, JSONResponse):
         return user_json
-    if limit > 50 or limit < 0 or offset < 0:
-        return JSONResponse(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            content={
-                'reason': 'Некорректный offset или limit!'
-            }
-        )
-    feed = get_feed_by_author(author=user_json['login'], limit=limit, offset=offset)
-    return JSONResponse(
-        status_code=status.HTTP_200_OK,
-        content=feed
-    )
+    after = check_page_params(limit=limit, offset=offset, cursor=cursor)
+    if isinstance(after, JSONResponse):
+        return after
+    async with reaction_counters.reading():
+        feed, next_key = await get_feed_page(author=user_json['login'], limit=limit, offset=offset, after=after)
+        feed = [reaction_counters.merge(post) for post in feed]
+    return page_response(feed, next_key)
+
+
+@app.get('/api/timeline/home')
+async def get_home_feed(authorization: Annotated[str | None, Header()], limit: int = 5, cursor: str | None = None):
+    user_json = await token_data_validation(authorization=authorization)
+    if isinstance(user_json, JSONResponse):
+        return user_json
+    after = check_page_params(limit=limit, offset=0, cursor=cursor)
+    if isinstance(after, JSONResponse):
+        return after
+    async with reaction_counters.reading():
+        feed, next_key = await get_home_timeline(owner=user_json['login'], limit=limit, after=after)
+        feed = [reaction_counters.merge(post) for post in feed]
+    visible = await VisibilityPolicy(user_json['login']).can_view_many(post['author'] for post in feed)
+    feed = [post for post in feed if visible[post['author']]]
+    return page_response(feed, next_key)
 
 
 @app.get('/api/posts/feed/{login}')
-def get_other_feed(login: str, authorization: Annotated[str | None, Header()], limit: int = 5, offset: int = 0):
-    user_json = token_data_validation(authorization=authorization)
+async def get_other_feed(login: str, authorization: Annotated[str | None, Header()], limit: int = 5, offset: int = 0,
+                         cursor: str | None = None):
+    user_json = await token_data_validation(authorization=authorization)
     if isinstance(user_json, JSONResponse):
         return user_json
-    profile = get_user_profile_from_db(login=login)
-    if profile is None:
+    author = await get_user_from_db(login=login)
+    if author is None:
         return JSONResponse(status_code=status.HTTP_404_NOT_FOUND,
                             content={'reason': 'Юзера с данным логином не существует!'})
-    if limit > 50 or limit < 0 or offset < 0:
-        return JSONResponse(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            content={
-                'reason': 'Некорректный offset или limit!'
-            }
-        )
-    feed = get_feed_by_author(author=login, limit=limit, offset=offset)
-    if login == user_json['login']:
-        return feed
-    if user_json['login'] in get_friends_from_database(friend_from_login=login):
-        return feed
-    elif profile['isPublic'] == 'true':
-        return feed
-    else:
+    after = check_page_params(limit=limit, offset=offset, cursor=cursor)
+    if isinstance(after, JSONResponse):
+        return after
+    if not await VisibilityPolicy(user_json['login']).can_view(login, is_public=author.isPublic):
         return JSONResponse(
             status_code=status.HTTP_404_NOT_FOUND,
             content={'reason': 'У вас нет доступа к данной публикации!'}
         )
+    async with reaction_counters.reading():
+        feed, next_key = await get_feed_page(author=login, limit=limit, offset=offset, after=after)
+        feed = [reaction_counters.merge(post) for post in feed]
+    return page_response(feed, next_key)
 
 
-@app.post('/api/posts/{postId}/like')
-def like_post(postId: str, authorization: Annotated[str | None, Header()]):
-    user_json = token_data_validation(authorization=authorization)
+async def react(post_id: str, authorization: str | None, reaction: str):
+    user_json = await token_data_validation(authorization=authorization)
     if isinstance(user_json, JSONResponse):
         return user_json
-    reaction = get_reaction(post_id=postId, login=user_json['login'])
-    post = get_post_from_db(post_id=postId)
+    post = await get_post_from_db(post_id=post_id)
     if post is None:
         return JSONResponse(
             status_code=status.HTTP_404_NOT_FOUND,
             content={'reason': 'Поста с данным айди не существует!'}
         )
-    if ((user_json['login'] == post['author']) or
-            (user_json['login'] in get_friends_from_database(friend_from_login=post['author'])
-             or get_user_from_db(login=post['author'])['isPublic'] is True)):
-        if reaction == 'like':
-            return post
-        if reaction == 'dislike':
-            post['dislikesCount'] -= 1
-            post['likesCount'] += 1
-            update_reaction(reaction='like', login=user_json['login'], post_id=postId)
-            update_posts_counts(post_id=postId, likesCount=post['likesCount'], dislikesCount=post['dislikesCount'])
-            return post
-        if reaction is None:
-            post['likesCount'] += 1
-            insert_reaction(reaction='like', login=user_json['login'], post_id=postId)
-            update_posts_counts(post_id=postId, likesCount=post['likesCount'], dislikesCount=post['dislikesCount'])
-            return post
+    if await VisibilityPolicy(user_json['login']).can_view(post['author']):
+        if not reaction_counters.buffered:
+            return await react_to_post(post_id=post_id, login=user_json['login'], reaction=reaction)
+        async with reaction_counters.reading():
+            previous, post = await record_reaction(post_id=post_id, login=user_json['login'], reaction=reaction)
+            reaction_counters.add(post_id, *reaction_delta(previous, reaction))
+            return reaction_counters.merge(post)
     else:
         return JSONResponse(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -424,46 +583,31 @@ def like_post(postId: str, authorization: Annotated[str | None, Header()]):
         )
 
 
+@app.post('/api/posts/{postId}/like')
+async def like_post(postId: str, authorization: Annotated[str | None, Header()]):
+    return await react(post_id=postId, authorization=authorization, reaction='like')
+
+
 @app.post('/api/posts/{postId}/dislike')
-def like_post(postId: str, authorization: Annotated[str | None, Header()]):
-    user_json = token_data_validation(authorization=authorization)
-    if isinstance(user_json, JSONResponse):
-        return user_json
-    reaction = get_reaction(post_id=postId, login=user_json['login'])
-    post = get_post_from_db(post_id=postId)
-    if post is None:
-        return JSONResponse(
-            status_code=status.HTTP_404_NOT_FOUND,
-            content={'reason': 'Поста с данным айди не существует!'}
-        )
-    if ((user_json['login'] == post['author']) or
-            (user_json['login'] in get_friends_from_database(friend_from_login=post['author'])
-             or get_user_from_db(login=post['author'])['isPublic'] is True)):
-        if reaction == 'dislike':
-            return post
-        if reaction == 'like':
-            post['dislikesCount'] += 1
-            post['likesCount'] -= 1
-            update_reaction(reaction='dislike', login=user_json['login'], post_id=postId)
-            update_posts_counts(post_id=postId, likesCount=post['likesCount'], dislikesCount=post['dislikesCount'])
-            return post
-        if reaction is None:
-            post['dislikesCount'] += 1
-            insert_reaction(reaction='dislike', login=user_json['login'], post_id=postId)
-            update_posts_counts(post_id=postId, likesCount=post['likesCount'], dislikesCount=post['dislikesCount'])
-            return post
-    else:
-        return JSONResponse(
-            status_code=status.HTTP_404_NOT_FOUND,
-            content={'reason': 'Доступ к данному посту ограничен!'}
-        )
+async def dislike_post(postId: str, authorization: Annotated[str | None, Header()]):
+    return await react(post_id=postId, authorization=authorization, reaction='dislike')
 
 
 @app.exception_handler(RequestValidationError)
-async def validation_error():
+async def validation_error(request, exc):
     return JSONResponse(
         status_code=status.HTTP_400_BAD_REQUEST,
         content={
             'reason': 'Вы отправили некорректную форму'
         }
     )
+
+
+@app.exception_handler(StorageUnavailable)
+async def storage_unavailable_error(request, exc):
+    return JSONResponse(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        content={
+            'reason': 'Сервер перегружен, попробуйте позже'
+        }
+    )
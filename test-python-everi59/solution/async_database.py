@@ -0,0 +1,558 @@
+import asyncio
+import heapq
+import logging
+import random
+import time
+import weakref
+from contextlib import asynccontextmanager
+from itertools import groupby, islice
+
+import psycopg
+from psycopg_pool import AsyncConnectionPool, PoolTimeout
+from starlette.concurrency import run_in_threadpool
+
+from .config import load_configs, load_pool_configs, load_startup_configs, load_timeline_configs, load_tags_configs
+from .migrations import MIGRATIONS, get_schema_version, migrate
+from .models import UserRecord
+from .records import USER_UPDATABLE_COLUMNS, StorageUnavailable, format_datetime, reaction_delta
+from .statements import execute_async, statements_settings
+
+conn_settings = load_configs()
+pool_settings = load_pool_configs()
+startup_settings = load_startup_configs()
+conn_kwargs = {'host': conn_settings['host'], 'dbname': conn_settings['data'], 'user': conn_settings['username'],
+               'password': conn_settings['password'], 'port': conn_settings['port']}
+timeline_settings = load_timeline_configs()
+tags_settings = load_tags_configs()
+TIMELINE_LOCK_ID = 5959002
+VISIBLE_TO_VIEWER = """(u.login = %(viewer)s OR u.isPublic IS TRUE OR EXISTS(
+                           SELECT 1 FROM FriendsDatabase f
+                           WHERE f.friend_from_login = u.login AND f.friend_to_login = %(viewer)s))"""
+returned_at = weakref.WeakKeyDictionary()
+usage = {'in_use': 0, 'max_in_use': 0}
+
+
+async def check_connection(conn):
+    if time.monotonic() - returned_at.get(conn, 0) >= pool_settings['health_check_interval']:
+        await AsyncConnectionPool.check_connection(conn)
+
+
+async def mark_returned(conn):
+    returned_at[conn] = time.monotonic()
+
+
+if not 0 <= pool_settings['min_size'] <= pool_settings['max_size'] or pool_settings['max_size'] < 1:
+    raise ValueError('Некорректные размеры пула соединений!')
+pool = AsyncConnectionPool(kwargs={**conn_kwargs, 'prepare_threshold': 0 if statements_settings['prepared'] else None},
+                           min_size=pool_settings['min_size'], max_size=pool_settings['max_size'],
+                           timeout=pool_settings['timeout'], check=check_connection, reset=mark_returned, open=False)
+
+
+@asynccontextmanager
+async def connection():
+    try:
+        conn = await pool.getconn()
+    except PoolTimeout as e:
+        raise StorageUnavailable(f'Не удалось получить соединение с БД за {pool.timeout} с') from e
+    usage['in_use'] += 1
+    usage['max_in_use'] = max(usage['max_in_use'], usage['in_use'])
+    try:
+        yield conn
+    finally:
+        usage['in_use'] -= 1
+        await pool.putconn(conn)
+
+
+def apply_migrations() -> tuple[list, int]:
+    with psycopg.connect(**conn_kwargs) as conn:
+        applied = []
+        if startup_settings['migrate']:
+            applied = migrate(conn, fan_out_limit=timeline_settings['fan_out_limit'])
+        version = get_schema_version(conn)
+        conn.commit()
+    return applied, version
+
+
+async def init_database() -> dict:
+    started = time.monotonic()
+    attempts = max(startup_settings['attempts'], 1)
+    delay = startup_settings['backoff']
+    for attempt in range(1, attempts + 1):
+        try:
+            applied, version = await run_in_threadpool(apply_migrations)
+            break
+        except psycopg.OperationalError as e:
+            if attempt == attempts:
+                raise
+            logging.getLogger(__name__).warning('БД недоступна (попытка %d из %d): %s', attempt, attempts, e)
+            await asyncio.sleep(delay * random.uniform(0.5, 1.0))
+            delay = min(delay * 2, startup_settings['max_backoff'])
+    await pool.open(wait=True, timeout=pool_settings['timeout'])
+    if version < MIGRATIONS[-1][0]:
+        logging.getLogger(__name__).warning('Схема БД версии %d отстаёт от последней миграции %d',
+                                            version, MIGRATIONS[-1][0])
+    return {'attempts': attempt, 'applied': applied, 'schema_version': version,
+            'seconds': time.monotonic() - started}
+
+
+async def close_database():
+    await pool.close()
+
+
+def pool_stats() -> dict:
+    stats = pool.get_stats()
+    return {
+        'min_size': pool.min_size,
+        'max_size': pool.max_size,
+        'size': stats.get('pool_size', 0),
+        'idle': stats.get('pool_available', 0),
+        'in_use': usage['in_use'],
+        'waiting': stats.get('requests_waiting', 0),
+        'max_in_use': usage['max_in_use'],
+        'saturation': usage['in_use'] / pool.max_size,
+        'acquired_total': stats.get('requests_num', 0),
+        'waits_total': stats.get('requests_queued', 0),
+        'wait_seconds_total': stats.get('requests_wait_ms', 0) / 1000,
+        'timeouts_total': stats.get('requests_errors', 0),
+        'reconnects_total': stats.get('connections_lost', 0)
+    }
+
+
+async def get_countries():
+    async with connection() as conn:
+        cur = conn.cursor()
+        await execute_async(cur, 'get_countries', """SELECT name, alpha2, alpha3, region FROM countries;""")
+        s = await cur.fetchall()
+        res = []
+        for country in s:
+            res.append({
+                'name': country[0],
+                'alpha2': country[1],
+                'alpha3': country[2],
+                'region': country[3]
+            })
+        await conn.commit()
+        await cur.close()
+        return res
+
+
+async def check_user(login, email, phone):
+    async with connection() as conn:
+        cur = conn.cursor()
+        await execute_async(cur, 'check_user',
+                            """SELECT login = %(login)s, email = %(email)s, phone = %(phone)s FROM UsersDatabase
+                               WHERE login = %(login)s OR email = %(email)s OR phone = %(phone)s;""",
+                            {'login': login, 'email': email, 'phone': phone})
+        s = await cur.fetchall()
+        await conn.commit()
+        await cur.close()
+        for i, field in enumerate(('login', 'email', 'phone')):
+            if any(row[i] for row in s):
+                return field
+        return None
+
+
+async def register_user(login, email, hashed_password, countryCode, isPublic, phone, image):
+    async with connection() as conn:
+        cur = conn.cursor()
+        await execute_async(cur, 'register_user',
+                            """INSERT INTO UsersDatabase (login, email, hashed_password, countryCode, isPublic, phone,
+                                                          image)
+                               VALUES (%s, %s, %s, %s, %s, %s, %s);""",
+                            (login, email, hashed_password, countryCode, isPublic, phone, image))
+        await conn.commit()
+        await cur.close()
+
+
+async def get_user_from_db(login: str) -> UserRecord | None:
+    async with connection() as conn:
+        cur = conn.cursor()
+        await execute_async(cur, 'get_user',
+                            """SELECT login, email, hashed_password, countryCode, isPublic, phone, image, tokenVersion
+                               FROM UsersDatabase WHERE login = %s;""", (login,))
+        s = await cur.fetchone()
+        await conn.commit()
+        await cur.close()
+        return UserRecord._make(s) if s else None
+
+
+async def update_user_profile(login, **kwargs):
+    columns = sorted(kwargs)
+    if not columns:
+        return
+    if not set(columns) <= USER_UPDATABLE_COLUMNS:
+        raise ValueError(f'Unknown user columns: {set(columns) - USER_UPDATABLE_COLUMNS}')
+    async with connection() as conn:
+        cur = conn.cursor()
+        await execute_async(cur, f'update_user_{"_".join(columns)}',
+                            f"""UPDATE UsersDatabase
+                                SET {', '.join(f'{column} = %({column})s' for column in columns)}
+                                WHERE login = %(login)s;""", {**kwargs, 'login': login})
+        await conn.commit()
+        await cur.close()
+
+
+async def update_user_password(login, hashed_password):
+    async with connection() as conn:
+        cur = conn.cursor()
+        await execute_async(cur, 'update_user_password',
+                            """UPDATE UsersDatabase SET hashed_password = %s, tokenVersion = tokenVersion + 1
+                               WHERE login = %s;""", (hashed_password, login))
+        await conn.commit()
+        await cur.close()
+
+
+async def check_user_for_update(login, phone):
+    if not phone:
+        return None
+    async with connection() as conn:
+        cur = conn.cursor()
+        await execute_async(cur, 'check_user_for_update',
+                            """SELECT EXISTS(SELECT 1 FROM UsersDatabase WHERE phone = %s AND login <> %s);""",
+                            (phone, login))
+        s = await cur.fetchone()
+        await conn.commit()
+        await cur.close()
+        return 'phone' if s[0] else None
+
+
+async def check_friendship(friend_from_login, friend_to_login) -> bool:
+    async with connection() as conn:
+        cur = conn.cursor()
+        await execute_async(cur, 'check_friendship',
+                            """SELECT EXISTS(SELECT 1 FROM FriendsDatabase
+                                             WHERE friend_from_login = %s AND friend_to_login = %s);""",
+                            (friend_from_login, friend_to_login))
+        s = (await cur.fetchone())[0]
+        await conn.commit()
+        await cur.close()
+        return s
+
+
+async def get_visibility(viewer, authors) -> dict:
+    async with connection() as conn:
+        cur = conn.cursor()
+        await execute_async(cur, 'get_visibility',
+                            f"""SELECT u.login, {VISIBLE_TO_VIEWER}
+                                FROM UsersDatabase u WHERE u.login = ANY(%(authors)s);""",
+                            {'viewer': viewer, 'authors': list(authors)})
+        s = dict(await cur.fetchall())
+        await conn.commit()
+        await cur.close()
+        return s
+
+
+async def get_friends_page(friend_from_login, limit, offset=0, after=None):
+    async with connection() as conn:
+        cur = conn.cursor()
+        if after:
+            await execute_async(cur, 'get_friends_page_after',
+                                """SELECT friend_to_login, addedAt FROM FriendsDatabase
+                                   WHERE friend_from_login = %s AND (addedAt, friend_to_login) < (%s, %s)
+                                   ORDER BY addedAt DESC, friend_to_login DESC LIMIT %s;""",
+                                (friend_from_login, after[0], after[1], limit))
+        else:
+            await execute_async(cur, 'get_friends_page',
+                                """SELECT friend_to_login, addedAt FROM FriendsDatabase WHERE friend_from_login = %s
+                                   ORDER BY addedAt DESC, friend_to_login DESC LIMIT %s OFFSET %s;""",
+                                (friend_from_login, limit, offset))
+        s = await cur.fetchall()
+        await conn.commit()
+        await cur.close()
+        res = [{'login': i[0], 'addedAt': format_datetime(i[1])} for i in s]
+        next_key = (s[-1][1], s[-1][0]) if s and len(s) == limit else None
+        return res, next_key
+
+
+async def add_friend_to_database(friend_from_login, friend_to_login, addedAt):
+    async with connection() as conn:
+        cur = conn.cursor()
+        await execute_async(cur, 'lock_author_timeline',
+                            """SELECT pg_advisory_xact_lock(%s, hashtext(%s));""", (TIMELINE_LOCK_ID, friend_to_login))
+        await execute_async(cur, 'add_friend',
+                            """INSERT INTO FriendsDatabase (friend_from_login, friend_to_login, addedAt)
+                               VALUES (%s, %s, %s)
+                               ON CONFLICT (friend_from_login, friend_to_login) DO NOTHING
+                               RETURNING friend_to_login;""",
+                            (friend_from_login, friend_to_login, addedAt))
+        if await cur.fetchone():
+            await execute_async(cur, 'backfill_home_timeline',
+                                """INSERT INTO HomeTimeline (owner, post_id, author, createdAt)
+                                   SELECT %s, post_id, author, createdAt FROM PostsDatabase
+                                   WHERE author = %s AND fannedOut ORDER BY createdAt DESC, post_id DESC LIMIT %s
+                                   ON CONFLICT DO NOTHING;""",
+                                (friend_from_login, friend_to_login, timeline_settings['backfill']))
+        await conn.commit()
+        await cur.close()
+
+
+async def remove_friend_from_database(friend_from_login, friend_to_login):
+    async with connection() as conn:
+        cur = conn.cursor()
+        await execute_async(cur, 'lock_author_timeline',
+                            """SELECT pg_advisory_xact_lock(%s, hashtext(%s));""", (TIMELINE_LOCK_ID, friend_to_login))
+        await execute_async(cur, 'remove_friend',
+                            """DELETE FROM FriendsDatabase WHERE friend_from_login = %s AND friend_to_login = %s;""",
+                            (friend_from_login, friend_to_login))
+        await execute_async(cur, 'remove_from_home_timeline',
+                            """DELETE FROM HomeTimeline WHERE owner = %s AND author = %s;""",
+                            (friend_from_login, friend_to_login))
+        await conn.commit()
+        await cur.close()
+
+
+async def insert_new_post(post_id: str, content: str, author: str,
+                          tags: list, createdAt: str):
+    async with connection() as conn:
+        cur = conn.cursor()
+        await execute_async(cur, 'lock_author_timeline_shared',
+                            """SELECT pg_advisory_xact_lock_shared(%s, hashtext(%s));""", (TIMELINE_LOCK_ID, author))
+        await execute_async(cur, 'get_fan_out_on_read',
+                            """SELECT fanOutOnRead FROM UsersDatabase WHERE login = %s;""", (author,))
+        fan_out_on_read = (await cur.fetchone())[0]
+        if not fan_out_on_read:
+            await execute_async(cur, 'count_followers',
+                                """SELECT count(*) FROM (SELECT 1 FROM FriendsDatabase
+                                                         WHERE friend_to_login = %s LIMIT %s) f;""",
+                                (author, timeline_settings['fan_out_limit'] + 1))
+            if (await cur.fetchone())[0] > timeline_settings['fan_out_limit']:
+                fan_out_on_read = True
+                await execute_async(cur, 'set_fan_out_on_read',
+                                    """UPDATE UsersDatabase SET fanOutOnRead = TRUE WHERE login = %s;""", (author,))
+        await execute_async(cur, 'insert_post',
+                            """INSERT INTO PostsDatabase (post_id, content, author, tags, createdAt, likesCount,
+                                                          dislikesCount, fannedOut)
+                               VALUES (%s, %s, %s, %s::TEXT[], %s, 0, 0, %s);""",
+                            (post_id, content, author, tags, createdAt, not fan_out_on_read))
+        if not fan_out_on_read:
+            await execute_async(cur, 'fan_out_post',
+                                """INSERT INTO HomeTimeline (owner, post_id, author, createdAt)
+                                   SELECT friend_from_login, %s, %s, %s::TIMESTAMPTZ FROM FriendsDatabase
+                                   WHERE friend_to_login = %s;""", (post_id, author, createdAt, author))
+        if tags:
+            await execute_async(cur, 'count_post_tags',
+                                """INSERT INTO TagCounts (tag, bucket, postsCount)
+                                   SELECT tag, date_trunc('hour', %s::TIMESTAMPTZ), 1
+                                   FROM (SELECT DISTINCT unnest(%s::TEXT[]) AS tag) t ORDER BY tag
+                                   ON CONFLICT (bucket, tag) DO UPDATE SET postsCount = TagCounts.postsCount + 1;""",
+                                (createdAt, tags))
+        await conn.commit()
+        await cur.close()
+
+
+def make_post(row) -> dict:
+    return {
+        "post_id": row[0],
+        "content": row[1],
+        "author": row[2],
+        "tags": row[3],
+        "createdAt": format_datetime(row[4]),
+        "likesCount": row[5],
+        "dislikesCount": row[6]
+        }
+
+
+async def get_post_from_db(post_id: str):
+    async with connection() as conn:
+        cur = conn.cursor()
+        await execute_async(cur, 'get_post',
+                            """SELECT post_id, content, author, tags, createdAt, likesCount, dislikesCount
+                               FROM PostsDatabase WHERE post_id = %s;""", (post_id,))
+        s = await cur.fetchone()
+        await conn.commit()
+        await cur.close()
+        if s:
+            return make_post(s)
+        return None
+
+
+async def get_feed_page(author: str, limit: int, offset=0, after=None):
+    async with connection() as conn:
+        cur = conn.cursor()
+        if after:
+            await execute_async(cur, 'get_feed_page_after',
+                                """SELECT post_id, content, author, tags, createdAt, likesCount, dislikesCount
+                                   FROM PostsDatabase WHERE author = %s AND (createdAt, post_id) < (%s, %s)
+                                   ORDER BY createdAt DESC, post_id DESC LIMIT %s;""",
+                                (author, after[0], after[1], limit))
+        else:
+            await execute_async(cur, 'get_feed_page',
+                                """SELECT post_id, content, author, tags, createdAt, likesCount, dislikesCount
+                                   FROM PostsDatabase WHERE author = %s
+                                   ORDER BY createdAt DESC, post_id DESC LIMIT %s OFFSET %s;""",
+                                (author, limit, offset))
+        s = await cur.fetchall()
+        await conn.commit()
+        await cur.close()
+        res = [make_post(i) for i in s]
+        next_key = (s[-1][4], s[-1][0]) if s and len(s) == limit else None
+        return res, next_key
+
+
+async def get_home_timeline(owner: str, limit: int, after=None):
+    after = after or (None, None)
+    async with connection() as conn:
+        cur = conn.cursor()
+        await execute_async(cur, 'get_home_timeline',
+                            """SELECT p.post_id, p.content, p.author, p.tags, p.createdAt, p.likesCount,
+                                      p.dislikesCount
+                               FROM HomeTimeline h JOIN PostsDatabase p ON p.post_id = h.post_id
+                               WHERE h.owner = %(owner)s
+                                 AND (%(created_at)s::TIMESTAMPTZ IS NULL
+                                      OR (h.createdAt, h.post_id) < (%(created_at)s, %(post_id)s))
+                               ORDER BY h.createdAt DESC, h.post_id DESC LIMIT %(limit)s;""",
+                            {'owner': owner, 'created_at': after[0], 'post_id': after[1], 'limit': limit})
+        materialized = await cur.fetchall()
+        await execute_async(cur, 'get_fanned_in_posts',
+                            """SELECT p.post_id, p.content, p.author, p.tags, p.createdAt, p.likesCount,
+                                      p.dislikesCount
+                               FROM FriendsDatabase f
+                               JOIN UsersDatabase u ON u.login = f.friend_to_login AND u.fanOutOnRead
+                               CROSS JOIN LATERAL (
+                                   SELECT * FROM PostsDatabase p
+                                   WHERE p.author = f.friend_to_login AND NOT p.fannedOut
+                                     AND (%(created_at)s::TIMESTAMPTZ IS NULL
+                                          OR (p.createdAt, p.post_id) < (%(created_at)s, %(post_id)s))
+                                   ORDER BY p.createdAt DESC, p.post_id DESC LIMIT %(limit)s) p
+                               WHERE f.friend_from_login = %(owner)s
+                               ORDER BY p.author, p.createdAt DESC, p.post_id DESC;""",
+                            {'owner': owner, 'created_at': after[0], 'post_id': after[1], 'limit': limit})
+        fanned_in = [list(rows) for _, rows in groupby(await cur.fetchall(), key=lambda row: row[2])]
+        await conn.commit()
+        await cur.close()
+        s = list(islice(heapq.merge(materialized, *fanned_in, key=lambda row: (row[4], row[0]), reverse=True), limit))
+        next_key = (s[-1][4], s[-1][0]) if s and len(s) == limit else None
+        return [make_post(i) for i in s], next_key
+
+
+async def search_posts_by_tag(viewer: str, tag: str, limit: int, after=None):
+    after = after or (None, None)
+    async with connection() as conn:
+        cur = conn.cursor()
+        await execute_async(cur, 'search_posts_by_tag',
+                            f"""SELECT p.post_id, p.content, p.author, p.tags, p.createdAt, p.likesCount,
+                                       p.dislikesCount
+                                FROM PostsDatabase p JOIN UsersDatabase u ON u.login = p.author
+                                WHERE p.tags @> ARRAY[%(tag)s]::TEXT[] AND {VISIBLE_TO_VIEWER}
+                                  AND (%(created_at)s::TIMESTAMPTZ IS NULL
+                                       OR (p.createdAt, p.post_id) < (%(created_at)s, %(post_id)s))
+                                ORDER BY p.createdAt DESC, p.post_id DESC LIMIT %(limit)s;""",
+                            {'viewer': viewer, 'tag': tag, 'created_at': after[0], 'post_id': after[1],
+                             'limit': limit})
+        s = await cur.fetchall()
+        await conn.commit()
+        await cur.close()
+        next_key = (s[-1][4], s[-1][0]) if s and len(s) == limit else None
+        return [make_post(i) for i in s], next_key
+
+
+async def search_posts_by_text(viewer: str, q: str, limit: int, tag=None, after=None):
+    after = after or (None, None, None)
+    async with connection() as conn:
+        cur = conn.cursor()
+        await execute_async(cur, 'search_posts_by_text',
+                            f"""SELECT post_id, content, author, tags, createdAt, likesCount, dislikesCount, rank
+                                FROM (
+                                    SELECT p.*, ts_rank(p.searchVector, query) AS rank
+                                    FROM PostsDatabase p JOIN UsersDatabase u ON u.login = p.author,
+                                         websearch_to_tsquery('russian', %(q)s) query
+                                    WHERE p.searchVector @@ query AND {VISIBLE_TO_VIEWER}
+                                      AND (%(tag)s::TEXT IS NULL OR p.tags @> ARRAY[%(tag)s]::TEXT[])) r
+                                WHERE (%(rank)s::REAL IS NULL
+                                       OR (rank, createdAt, post_id) < (%(rank)s::REAL, %(created_at)s, %(post_id)s))
+                                ORDER BY rank DESC, createdAt DESC, post_id DESC LIMIT %(limit)s;""",
+                            {'viewer': viewer, 'q': q, 'tag': tag, 'rank': after[0], 'created_at': after[1],
+                             'post_id': after[2], 'limit': limit})
+        s = await cur.fetchall()
+        await conn.commit()
+        await cur.close()
+        next_key = (s[-1][7], s[-1][4], s[-1][0]) if s and len(s) == limit else None
+        return [make_post(i) for i in s], next_key
+
+
+async def get_trending_tags(limit: int):
+    async with connection() as conn:
+        cur = conn.cursor()
+        await execute_async(cur, 'get_trending_tags',
+                            """SELECT tag, sum(postsCount) AS postsCount FROM TagCounts
+                               WHERE bucket >= date_trunc('hour', now()) - make_interval(hours => %s)
+                               GROUP BY tag ORDER BY postsCount DESC, tag LIMIT %s;""",
+                            (tags_settings['trending_window_hours'], limit))
+        s = await cur.fetchall()
+        await conn.commit()
+        await cur.close()
+        return [{'tag': i[0], 'postsCount': int(i[1])} for i in s]
+
+
+async def upsert_reaction(cur, post_id, login, reaction):
+    while True:
+        await execute_async(cur, 'lock_reaction',
+                            """SELECT reaction FROM PostsReactionDatabase WHERE post_id = %s AND login = %s
+                               FOR UPDATE;""", (post_id, login))
+        s = await cur.fetchone()
+        if s:
+            if s[0] != reaction:
+                await execute_async(cur, 'update_reaction',
+                                    """UPDATE PostsReactionDatabase SET reaction = %s
+                                       WHERE post_id = %s AND login = %s;""", (reaction, post_id, login))
+            return s[0]
+        await execute_async(cur, 'insert_reaction',
+                            """INSERT INTO PostsReactionDatabase (post_id, login, reaction) VALUES (%s, %s, %s)
+                               ON CONFLICT (post_id, login) DO NOTHING RETURNING reaction;""",
+                            (post_id, login, reaction))
+        if await cur.fetchone():
+            return None
+
+
+async def react_to_post(post_id, login, reaction):
+    async with connection() as conn:
+        cur = conn.cursor()
+        previous = await upsert_reaction(cur, post_id, login, reaction)
+        likes, dislikes = reaction_delta(previous, reaction)
+        if likes or dislikes:
+            await execute_async(cur, 'apply_reaction_delta',
+                                """UPDATE PostsDatabase
+                                   SET likesCount = likesCount + %s, dislikesCount = dislikesCount + %s
+                                   WHERE post_id = %s
+                                   RETURNING post_id, content, author, tags, createdAt, likesCount, dislikesCount;""",
+                                (likes, dislikes, post_id))
+        else:
+            await execute_async(cur, 'get_post',
+                                """SELECT post_id, content, author, tags, createdAt, likesCount, dislikesCount
+                                   FROM PostsDatabase WHERE post_id = %s;""", (post_id,))
+        s = await cur.fetchone()
+        await conn.commit()
+        await cur.close()
+        if s:
+            return make_post(s)
+        return None
+
+
+async def record_reaction(post_id, login, reaction):
+    async with connection() as conn:
+        cur = conn.cursor()
+        previous = await upsert_reaction(cur, post_id, login, reaction)
+        await execute_async(cur, 'get_post',
+                            """SELECT post_id, content, author, tags, createdAt, likesCount, dislikesCount
+                               FROM PostsDatabase WHERE post_id = %s;""", (post_id,))
+        s = await cur.fetchone()
+        await conn.commit()
+        await cur.close()
+        return previous, make_post(s) if s else None
+
+
+async def apply_counter_deltas(deltas: dict):
+    if not deltas:
+        return
+    post_ids = sorted(deltas)
+    async with connection() as conn:
+        cur = conn.cursor()
+        await execute_async(cur, 'apply_counter_deltas',
+                            """UPDATE PostsDatabase p
+                               SET likesCount = p.likesCount + d.likes, dislikesCount = p.dislikesCount + d.dislikes
+                               FROM unnest(%s::TEXT[], %s::INT[], %s::INT[]) AS d (post_id, likes, dislikes)
+                               WHERE p.post_id = d.post_id;""",
+                            (post_ids, [deltas[post_id][0] for post_id in post_ids],
+                             [deltas[post_id][1] for post_id in post_ids]))
+        await conn.commit()
+        await cur.close()
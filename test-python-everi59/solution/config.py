@@ -9,6 +9,115 @@ ALGORITHM = "HS256"
 def load_configs() -> dict:
     env = Env()
     env.read_env()
-    return {'username': os.environ['POSTGRES_USERNAME'], 'password': os.environ['POSTGRES_PASSWORD'],
-            'host': os.environ['POSTGRES_HOST'], 'port': os.environ['POSTGRES_PORT'],
-            'data': os.environ['POSTGRES_DATABASE']}
+    return {'username': env.str('POSTGRES_USERNAME', 'postgres'), 'password': env.str('POSTGRES_PASSWORD', '1234'),
+            'host': env.str('POSTGRES_HOST', 'localhost'), 'port': env.int('POSTGRES_PORT', 5432),
+            'data': env.str('POSTGRES_DATABASE', 'postgres')}
+
+
+def load_pool_configs() -> dict:
+    env = Env()
+    env.read_env()
+    return {'min_size': env.int('POSTGRES_POOL_MIN_SIZE', 1), 'max_size': env.int('POSTGRES_POOL_MAX_SIZE', 20),
+            'timeout': env.float('POSTGRES_POOL_TIMEOUT', 5.0),
+            'health_check_interval': env.float('POSTGRES_POOL_HEALTH_CHECK_INTERVAL', 30.0)}
+
+
+def load_storage_configs() -> dict:
+    env = Env()
+    env.read_env()
+    return {'engine': env.str('STORAGE_ENGINE', 'postgres'),
+            'memory_countries': env.str('STORAGE_MEMORY_COUNTRIES', '')}
+
+
+def load_startup_configs() -> dict:
+    env = Env()
+    env.read_env()
+    return {'attempts': env.int('POSTGRES_CONNECT_ATTEMPTS', 10), 'backoff': env.float('POSTGRES_CONNECT_BACKOFF', 0.5),
+            'max_backoff': env.float('POSTGRES_CONNECT_MAX_BACKOFF', 5.0),
+            'migrate': env.bool('POSTGRES_MIGRATE_ON_STARTUP', True)}
+
+
+def load_concurrency_configs() -> dict:
+    env = Env()
+    env.read_env()
+    return {'threadpool_size': env.int('THREADPOOL_SIZE', 40),
+            'hash_workers': env.int('PASSWORD_HASH_WORKERS', os.cpu_count() or 1)}
+
+
+def load_auth_cache_configs() -> dict:
+    env = Env()
+    env.read_env()
+    return {'maxsize': env.int('AUTH_CACHE_SIZE', 10000), 'ttl': env.float('AUTH_CACHE_TTL', 60.0)}
+
+
+def load_friendship_cache_configs() -> dict:
+    env = Env()
+    env.read_env()
+    return {'maxsize': env.int('FRIENDSHIP_CACHE_SIZE', 100000), 'ttl': env.float('FRIENDSHIP_CACHE_TTL', 30.0)}
+
+
+def load_timeline_configs() -> dict:
+    env = Env()
+    env.read_env()
+    return {'fan_out_limit': env.int('HOME_TIMELINE_FAN_OUT_LIMIT', 1000),
+            'backfill': env.int('HOME_TIMELINE_BACKFILL', 100)}
+
+
+def load_tags_configs() -> dict:
+    env = Env()
+    env.read_env()
+    return {'trending_window_hours': env.int('TRENDING_TAGS_WINDOW_HOURS', 24)}
+
+
+def load_password_hashing_configs() -> dict:
+    env = Env()
+    env.read_env()
+    default = env.str('PASSWORD_HASH_SCHEME', 'sha256_crypt')
+    # sha256_crypt: 535000 rounds (passlib) ~ 2 hash/s, 10000 ~ 170 hash/s per core (benchmarks.password_hashing)
+    return {'schemes': env.list('PASSWORD_HASH_SCHEMES', ['sha256_crypt', 'md5_crypt', 'des_crypt']),
+            'default': default,
+            'rounds': env.int('PASSWORD_HASH_ROUNDS', 10000 if default == 'sha256_crypt' else None)}
+
+
+def load_countries_configs() -> dict:
+    env = Env()
+    env.read_env()
+    return {'refresh_interval': env.float('COUNTRIES_REFRESH_INTERVAL', 0)}
+
+
+def load_http_cache_configs() -> dict:
+    env = Env()
+    env.read_env()
+    return {'countries_max_age': env.int('COUNTRIES_CACHE_MAX_AGE', 3600)}
+
+
+def load_counter_configs() -> dict:
+    env = Env()
+    env.read_env()
+    return {'buffered': env.bool('REACTION_COUNTERS_BUFFERED', False),
+            'flush_interval': env.float('REACTION_COUNTERS_FLUSH_INTERVAL', 1.0)}
+
+
+def load_statements_configs() -> dict:
+    env = Env()
+    env.read_env()
+    return {'prepared': env.bool('POSTGRES_PREPARED_STATEMENTS', True)}
+
+
+def load_metrics_configs() -> dict:
+    env = Env()
+    env.read_env()
+    return {'enabled': env.bool('METRICS_ENABLED', False),
+            'buckets': env.list('METRICS_BUCKETS', [0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0,
+                                                    2.5, 5.0], subcast=float)}
+
+
+def load_profiler_configs() -> dict:
+    env = Env()
+    env.read_env()
+    return {'enabled': env.bool('DEBUG_PROFILER_ENABLED', False),
+            'max_queries': env.int('DEBUG_PROFILER_MAX_QUERIES', 8),
+            'repeated_queries': env.int('DEBUG_PROFILER_REPEATED_QUERIES', 3),
+            'slow_ms': env.float('DEBUG_PROFILER_SLOW_MS', 200.0),
+            'sample_interval': env.float('DEBUG_PROFILER_SAMPLE_INTERVAL', 0.005),
+            'top': env.int('DEBUG_PROFILER_TOP', 20)}
@@ -0,0 +1,99 @@
+import asyncio
+import logging
+from contextlib import asynccontextmanager
+from typing import Awaitable, Callable
+
+
+class CounterBuffer:
+    def __init__(self, flusher: Callable[[dict], Awaitable[None]], buffered: bool = False,
+                 flush_interval: float = 1.0):
+        self._flusher = flusher
+        self.buffered = buffered
+        self.flush_interval = flush_interval
+        self._pending = {}
+        self._readers = 0
+        self._flushing = False
+        self._lock = asyncio.Condition()
+        self._flush_lock = asyncio.Lock()
+        self._stop = asyncio.Event()
+        self._task = None
+
+    def add(self, post_id: str, likes: int, dislikes: int):
+        if not likes and not dislikes:
+            return
+        pending_likes, pending_dislikes = self._pending.get(post_id, (0, 0))
+        self._pending[post_id] = (pending_likes + likes, pending_dislikes + dislikes)
+
+    def delta(self, post_id: str) -> tuple[int, int]:
+        return self._pending.get(post_id, (0, 0))
+
+    @asynccontextmanager
+    async def reading(self):
+        if not self.buffered:
+            yield
+            return
+        async with self._lock:
+            await self._lock.wait_for(lambda: not self._flushing)
+            self._readers += 1
+        try:
+            yield
+        finally:
+            async with self._lock:
+                self._readers -= 1
+                if not self._readers:
+                    self._lock.notify_all()
+
+    def merge(self, post: dict | None) -> dict | None:
+        if post is None or not self._pending:
+            return post
+        likes, dislikes = self.delta(post['post_id'])
+        post['likesCount'] += likes
+        post['dislikesCount'] += dislikes
+        return post
+
+    async def flush(self):
+        async with self._flush_lock:
+            async with self._lock:
+                if not self._pending:
+                    return
+                self._flushing = True
+                await self._lock.wait_for(lambda: not self._readers)
+                in_flight, self._pending = self._pending, {}
+            try:
+                await self._flusher({post_id: delta for post_id, delta in in_flight.items() if any(delta)})
+            except BaseException:
+                for post_id, (likes, dislikes) in in_flight.items():
+                    self.add(post_id, likes, dislikes)
+                raise
+            finally:
+                async with self._lock:
+                    self._flushing = False
+                    self._lock.notify_all()
+
+    def start(self):
+        if not self.buffered or self._task is not None:
+            return
+        self._stop.clear()
+        self._task = asyncio.create_task(self._flush_loop())
+
+    async def stop(self):
+        self._stop.set()
+        if self._task is not None:
+            await self._task
+            self._task = None
+        await self.flush()
+
+    async def _flush_loop(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._stop.wait(), self.flush_interval)
+                return
+            except asyncio.TimeoutError:
+                pass
+            try:
+                await self.flush()
+            except Exception:
+                logging.getLogger(__name__).exception('Не удалось записать счётчики реакций')
+
+    def __len__(self):
+        return len(self._pending)
@@ -0,0 +1,97 @@
+import asyncio
+import hashlib
+import json
+import logging
+from typing import Awaitable, Callable, Iterable, NamedTuple
+
+
+class CatalogSnapshot(NamedTuple):
+    by_alpha2: dict
+    by_region: dict
+    country_bodies: dict
+    list_bodies: dict
+
+
+class CountryCatalog:
+    def __init__(self, loader: Callable[[], Awaitable[list]], refresh_interval: float = 0):
+        self._loader = loader
+        self.refresh_interval = refresh_interval
+        self._snapshot = None
+        self._stop = asyncio.Event()
+        self._task = None
+
+    async def load(self):
+        countries = sorted(await self._loader(), key=lambda country: country['alpha2'])
+        by_region = {}
+        for country in countries:
+            by_region.setdefault(country['region'], []).append(country)
+        snapshot = CatalogSnapshot(
+            by_alpha2={country['alpha2']: country for country in countries},
+            by_region=by_region,
+            country_bodies={country['alpha2']: self._dumps(country) for country in countries},
+            list_bodies={None: self._dumps(countries)}
+        )
+        for region, region_countries in by_region.items():
+            snapshot.list_bodies[frozenset((region,))] = self._dumps(region_countries)
+        self._snapshot = snapshot
+        return snapshot
+
+    @property
+    def snapshot(self) -> CatalogSnapshot:
+        if self._snapshot is None:
+            raise RuntimeError('Справочник стран ещё не загружен')
+        return self._snapshot
+
+    @staticmethod
+    def _dumps(value) -> tuple[bytes, str]:
+        body = json.dumps(value, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+        return body, '"' + hashlib.sha256(body).hexdigest()[:32] + '"'
+
+    def get(self, alpha2: str) -> dict | None:
+        return self.snapshot.by_alpha2.get(alpha2)
+
+    def contains(self, alpha2: str) -> bool:
+        return alpha2 in self.snapshot.by_alpha2
+
+    def get_body(self, alpha2: str) -> tuple[bytes, str] | None:
+        return self.snapshot.country_bodies.get(alpha2)
+
+    def list(self, regions: Iterable[str] | None = None) -> list:
+        snapshot = self.snapshot
+        if not regions:
+            return list(snapshot.by_alpha2.values())
+        regions = set(regions)
+        return [country for country in snapshot.by_alpha2.values() if country['region'] in regions]
+
+    def list_body(self, regions: Iterable[str] | None = None) -> tuple[bytes, str]:
+        snapshot = self.snapshot
+        key = frozenset(regions) if regions else None
+        body = snapshot.list_bodies.get(key)
+        if body is None:
+            body = self._dumps(self.list(key))
+            snapshot.list_bodies[key] = body
+        return body
+
+    def start_refresh(self):
+        if self.refresh_interval <= 0 or self._task is not None:
+            return
+        self._stop.clear()
+        self._task = asyncio.create_task(self._refresh_loop())
+
+    async def stop_refresh(self):
+        self._stop.set()
+        if self._task is not None:
+            await self._task
+            self._task = None
+
+    async def _refresh_loop(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._stop.wait(), self.refresh_interval)
+                return
+            except asyncio.TimeoutError:
+                pass
+            try:
+                await self.load()
+            except Exception:
+                logging.getLogger(__name__).exception('Не удалось обновить справочник стран')
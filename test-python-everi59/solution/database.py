@@ -1,322 +1,486 @@
+import heapq
+import logging
+import random
+import time
+from itertools import groupby, islice
+
 import psycopg2
-from .config import load_configs
+from psycopg2.extras import execute_values
+
+from .config import load_configs, load_pool_configs, load_startup_configs, load_timeline_configs, load_tags_configs
+from .migrations import MIGRATIONS, get_schema_version, migrate
+from .models import UserRecord
+from .pool import ConnectionPool, PreparingConnection
+from .records import USER_UPDATABLE_COLUMNS, format_datetime, reaction_delta
+from .statements import execute, observed
 
 conn_settings = load_configs()
-# conn = psycopg2.connect(host=conn_settings['host'], dbname=conn_settings['data'],
-#                         user=conn_settings['username'], password=conn_settings['password'], port=conn_settings['port'])
-conn = psycopg2.connect(host='localhost', dbname='postgres', user='postgres', password='1234', port=5432)
-
-
-def get_countries(region):
-    cur = conn.cursor()
-    if region:
-        cur.execute(f"""SELECT name, alpha2, alpha3, region FROM countries
-                    WHERE region='{region}';""")
-    else:
-        cur.execute(f"""SELECT name, alpha2, alpha3, region FROM countries;""")
-    s = cur.fetchall()
-    res = []
-    for country in s:
-        res.append({
-            'name': country[0],
-            'alpha2': country[1],
-            'alpha3': country[2],
-            'region': country[3]
-        })
-    conn.commit()
-    cur.close()
-    return res
-
-
-def get_country(alpha2):
-    cur = conn.cursor()
-    cur.execute(f"""SELECT name, alpha2, alpha3, region FROM countries
-                    WHERE alpha2='{alpha2}';""")
-    country = cur.fetchone()
-    conn.commit()
-    cur.close()
-    res = {
-        'name': country[0],
-        'alpha2': country[1],
-        'alpha3': country[2],
-        'region': country[3]
-    }
-    return res
-
-
-def create_users_database():
-    cur = conn.cursor()
-    cur.execute(f"""CREATE TABLE IF NOT EXISTS UsersDatabase
-                    (login TEXT PRIMARY KEY,
-                    email TEXT UNIQUE,
-                    hashed_password TEXT,
-                    countryCode TEXT,
-                    isPublic BOOL,
-                    phone TEXT UNIQUE,
-                    image TEXT);""")
-    conn.commit()
-    cur.close()
+pool_settings = load_pool_configs()
+startup_settings = load_startup_configs()
+pool = ConnectionPool(**pool_settings, host=conn_settings['host'], dbname=conn_settings['data'],
+                      user=conn_settings['username'], password=conn_settings['password'], port=conn_settings['port'],
+                      connection_factory=PreparingConnection)
+timeline_settings = load_timeline_configs()
+tags_settings = load_tags_configs()
+TIMELINE_LOCK_ID = 5959002
+VISIBLE_TO_VIEWER = """(u.login = %(viewer)s OR u.isPublic IS TRUE OR EXISTS(
+                           SELECT 1 FROM FriendsDatabase f
+                           WHERE f.friend_from_login = u.login AND f.friend_to_login = %(viewer)s))"""
+
+
+def init_database() -> dict:
+    started = time.monotonic()
+    attempts = max(startup_settings['attempts'], 1)
+    delay = startup_settings['backoff']
+    for attempt in range(1, attempts + 1):
+        try:
+            pool.open()
+            with pool.connection() as conn:
+                applied = []
+                if startup_settings['migrate']:
+                    applied = migrate(conn, fan_out_limit=timeline_settings['fan_out_limit'])
+                version = get_schema_version(conn)
+                conn.commit()
+            break
+        except psycopg2.OperationalError as e:
+            if attempt == attempts:
+                raise
+            logging.getLogger(__name__).warning('БД недоступна (попытка %d из %d): %s', attempt, attempts, e)
+            time.sleep(delay * random.uniform(0.5, 1.0))
+            delay = min(delay * 2, startup_settings['max_backoff'])
+    if version < MIGRATIONS[-1][0]:
+        logging.getLogger(__name__).warning('Схема БД версии %d отстаёт от последней миграции %d',
+                                            version, MIGRATIONS[-1][0])
+    return {'attempts': attempt, 'applied': applied, 'schema_version': version,
+            'seconds': time.monotonic() - started}
+
+
+def close_database():
+    pool.closeall()
+
+
+def pool_stats() -> dict:
+    return pool.stats()
+
+
+def get_countries():
+    with pool.connection() as conn:
+        cur = conn.cursor()
+        execute(cur, 'get_countries', """SELECT name, alpha2, alpha3, region FROM countries;""")
+        s = cur.fetchall()
+        res = []
+        for country in s:
+            res.append({
+                'name': country[0],
+                'alpha2': country[1],
+                'alpha3': country[2],
+                'region': country[3]
+            })
+        conn.commit()
+        cur.close()
+        return res
 
 
 def check_user(login, email, phone):
-    cur = conn.cursor()
-    cur.execute(f"""SELECT login, email, phone FROM UsersDatabase""")
-    users = cur.fetchall()
-    logins, emails, phones = [], [], []
-    for user in users:
-        logins.append(user[0])
-        emails.append(user[1])
-        phones.append(user[2])
-    print(logins, emails, phones)
-    conn.commit()
-    cur.close()
-    return login in logins or email in emails or (phone in phones if phone else False)
-
-
-def check_country_code(countryCode):
-    cur = conn.cursor()
-    cur.execute(f"""SELECT alpha2 FROM countries WHERE alpha2='{countryCode}'""")
-    s = cur.fetchone()
-    return True if s else False
+    with pool.connection() as conn:
+        cur = conn.cursor()
+        execute(cur, 'check_user',
+                """SELECT login = %(login)s, email = %(email)s, phone = %(phone)s FROM UsersDatabase
+                   WHERE login = %(login)s OR email = %(email)s OR phone = %(phone)s;""",
+                {'login': login, 'email': email, 'phone': phone})
+        s = cur.fetchall()
+        conn.commit()
+        cur.close()
+        for i, field in enumerate(('login', 'email', 'phone')):
+            if any(row[i] for row in s):
+                return field
+        return None
 
 
 def register_user(login, email, hashed_password, countryCode, isPublic, phone, image):
-    cur = conn.cursor()
-    cur.execute(f"""INSERT INTO UsersDatabase (login, email, hashed_password, countryCode, isPublic, phone, image)"""
-                f"""VALUES ('{login}', '{email}', '{hashed_password}', '{countryCode}', '{isPublic}', '{phone}', '{image}');""")
-    conn.commit()
-    cur.close()
-
-
-def get_user_from_db(login: str):
-    cur = conn.cursor()
-    cur.execute(f"SELECT * FROM UsersDatabase WHERE login='{login}'")
-    s = cur.fetchone()
-    if s:
-        result = {
-            'login': s[0],
-            'email': s[1],
-            'hashed_password': s[2],
-            'countryCode': s[3],
-            'isPublic': s[4],
-            'phone': s[5],
-            'image': s[6]
-        }
-        return result
-    return None
-
-
-def get_user_profile_from_db(login: str):
-    cur = conn.cursor()
-    cur.execute(f"SELECT login, email, countryCode, isPublic, phone, image FROM UsersDatabase WHERE login='{login}'")
-    s = cur.fetchone()
-    if s:
-        result = {
-            'login': s[0],
-            'email': s[1],
-            'countryCode': s[2],
-            'isPublic': s[3]
-        }
-        if s[4]:
-            result['phone'] = s[4]
-        if s[5]:
-            result['image'] = s[5]
-        return result
-    return None
+    with pool.connection() as conn:
+        cur = conn.cursor()
+        execute(cur, 'register_user',
+                """INSERT INTO UsersDatabase (login, email, hashed_password, countryCode, isPublic, phone, image)
+                   VALUES (%s, %s, %s, %s, %s, %s, %s);""",
+                (login, email, hashed_password, countryCode, isPublic, phone, image))
+        conn.commit()
+        cur.close()
+
+
+def get_user_from_db(login: str) -> UserRecord | None:
+    with pool.connection() as conn:
+        cur = conn.cursor()
+        execute(cur, 'get_user',
+                """SELECT login, email, hashed_password, countryCode, isPublic, phone, image, tokenVersion
+                   FROM UsersDatabase WHERE login = %s;""", (login,))
+        s = cur.fetchone()
+        conn.commit()
+        cur.close()
+        return UserRecord._make(s) if s else None
 
 
 def update_user_profile(login, **kwargs):
-    cur = conn.cursor()
-    for i in kwargs.keys():
-        cur.execute(f"""UPDATE UsersDatabase SET {i}='{kwargs[i]}' WHERE login='{login}'""")
-    conn.commit()
-    cur.close()
+    columns = sorted(kwargs)
+    if not columns:
+        return
+    if not set(columns) <= USER_UPDATABLE_COLUMNS:
+        raise ValueError(f'Unknown user columns: {set(columns) - USER_UPDATABLE_COLUMNS}')
+    with pool.connection() as conn:
+        cur = conn.cursor()
+        execute(cur, f'update_user_{"_".join(columns)}',
+                f"""UPDATE UsersDatabase SET {', '.join(f'{column} = %({column})s' for column in columns)}
+                    WHERE login = %(login)s;""", {**kwargs, 'login': login})
+        conn.commit()
+        cur.close()
+
+
+def update_user_password(login, hashed_password):
+    with pool.connection() as conn:
+        cur = conn.cursor()
+        execute(cur, 'update_user_password',
+                """UPDATE UsersDatabase SET hashed_password = %s, tokenVersion = tokenVersion + 1
+                   WHERE login = %s;""", (hashed_password, login))
+        conn.commit()
+        cur.close()
 
 
 def check_user_for_update(login, phone):
-    cur = conn.cursor()
-    cur.execute(f"""SELECT phone FROM UsersDatabase WHERE NOT(login='{login}')""")
-    users = cur.fetchall()
-    phones = []
-    for user in users:
-        phones.append(user[0])
-    conn.commit()
-    cur.close()
-    return phone in phones if phone else False
-
-
-def get_user_hashed_password(login: str):
-    cur = conn.cursor()
-    cur.execute(f"""SELECT hashed_password FROM UsersDatabase WHERE login='{login}'""")
-    s = cur.fetchone()
-    conn.commit()
-    cur.close()
-    return s[0]
-
-
-def create_friends_database():
-    cur = conn.cursor()
-    cur.execute(f"""CREATE TABLE IF NOT EXISTS FriendsDatabase
-                    (friend_from_login TEXT,
-                    friend_to_login TEXT,
-                    addedAt TEXT);""")
-    conn.commit()
-    cur.close()
-
-
-def get_friends_from_database(friend_from_login, offset=0, limit=0):
-    cur = conn.cursor()
-    if offset > 0 and limit > 0:
-        cur.execute(f"""SELECT friend_to_login, addedAt FROM FriendsDatabase WHERE friend_from_login='{friend_from_login}' 
-                ORDER BY friend_to_login OFFSET {offset} LIMIT {limit};""")
-    elif offset > 0:
-        cur.execute(f"""SELECT friend_to_login, addedAt FROM FriendsDatabase WHERE friend_from_login='{friend_from_login}' 
-                ORDER BY friend_to_login OFFSET {offset};""")
-    elif limit > 0:
-        cur.execute(f"""SELECT friend_to_login, addedAt FROM FriendsDatabase WHERE friend_from_login='{friend_from_login}' 
-                        ORDER BY friend_to_login LIMIT {limit};""")
-    else:
-        cur.execute(f"""SELECT friend_to_login FROM FriendsDatabase WHERE friend_from_login='{friend_from_login}';""")
-    s = cur.fetchall()
-    if offset == 0 and limit == 0:
-        s = [i[0] for i in s]
-    conn.commit()
-    cur.close()
-    return s
+    if not phone:
+        return None
+    with pool.connection() as conn:
+        cur = conn.cursor()
+        execute(cur, 'check_user_for_update',
+                """SELECT EXISTS(SELECT 1 FROM UsersDatabase WHERE phone = %s AND login <> %s);""",
+                (phone, login))
+        s = cur.fetchone()
+        conn.commit()
+        cur.close()
+        return 'phone' if s[0] else None
+
+
+def check_friendship(friend_from_login, friend_to_login) -> bool:
+    with pool.connection() as conn:
+        cur = conn.cursor()
+        execute(cur, 'check_friendship',
+                """SELECT EXISTS(SELECT 1 FROM FriendsDatabase
+                                 WHERE friend_from_login = %s AND friend_to_login = %s);""",
+                (friend_from_login, friend_to_login))
+        s = cur.fetchone()[0]
+        conn.commit()
+        cur.close()
+        return s
+
+
+def get_visibility(viewer, authors) -> dict:
+    with pool.connection() as conn:
+        cur = conn.cursor()
+        execute(cur, 'get_visibility',
+                f"""SELECT u.login, {VISIBLE_TO_VIEWER}
+                    FROM UsersDatabase u WHERE u.login = ANY(%(authors)s);""",
+                {'viewer': viewer, 'authors': list(authors)})
+        s = dict(cur.fetchall())
+        conn.commit()
+        cur.close()
+        return s
+
+
+def get_friends_page(friend_from_login, limit, offset=0, after=None):
+    with pool.connection() as conn:
+        cur = conn.cursor()
+        if after:
+            execute(cur, 'get_friends_page_after',
+                    """SELECT friend_to_login, addedAt FROM FriendsDatabase
+                       WHERE friend_from_login = %s AND (addedAt, friend_to_login) < (%s, %s)
+                       ORDER BY addedAt DESC, friend_to_login DESC LIMIT %s;""",
+                    (friend_from_login, after[0], after[1], limit))
+        else:
+            execute(cur, 'get_friends_page',
+                    """SELECT friend_to_login, addedAt FROM FriendsDatabase WHERE friend_from_login = %s
+                       ORDER BY addedAt DESC, friend_to_login DESC LIMIT %s OFFSET %s;""",
+                    (friend_from_login, limit, offset))
+        s = cur.fetchall()
+        conn.commit()
+        cur.close()
+        res = [{'login': i[0], 'addedAt': format_datetime(i[1])} for i in s]
+        next_key = (s[-1][1], s[-1][0]) if s and len(s) == limit else None
+        return res, next_key
 
 
 def add_friend_to_database(friend_from_login, friend_to_login, addedAt):
-    cur = conn.cursor()
-    cur.execute(f"""INSERT INTO FriendsDatabase (friend_from_login, friend_to_login, addedAt) VALUES 
-    ('{friend_from_login}', '{friend_to_login}', '{addedAt}');""")
-    conn.commit()
-    cur.close()
+    with pool.connection() as conn:
+        cur = conn.cursor()
+        execute(cur, 'lock_author_timeline',
+                """SELECT pg_advisory_xact_lock(%s, hashtext(%s));""", (TIMELINE_LOCK_ID, friend_to_login))
+        execute(cur, 'add_friend',
+                """INSERT INTO FriendsDatabase (friend_from_login, friend_to_login, addedAt) VALUES (%s, %s, %s)
+                   ON CONFLICT (friend_from_login, friend_to_login) DO NOTHING RETURNING friend_to_login;""",
+                (friend_from_login, friend_to_login, addedAt))
+        if cur.fetchone():
+            execute(cur, 'backfill_home_timeline',
+                    """INSERT INTO HomeTimeline (owner, post_id, author, createdAt)
+                       SELECT %s, post_id, author, createdAt FROM PostsDatabase
+                       WHERE author = %s AND fannedOut ORDER BY createdAt DESC, post_id DESC LIMIT %s
+                       ON CONFLICT DO NOTHING;""",
+                    (friend_from_login, friend_to_login, timeline_settings['backfill']))
+        conn.commit()
+        cur.close()
 
 
 def remove_friend_from_database(friend_from_login, friend_to_login):
-    cur = conn.cursor()
-    cur.execute(f"""DELETE FROM FriendsDatabase WHERE friend_from_login='{friend_from_login}' AND friend_to_login='{friend_to_login}');""")
-    conn.commit()
-    cur.close()
-
-
-def create_posts_database():
-    cur = conn.cursor()
-    cur.execute("CREATE TABLE IF NOT EXISTS PostsDatabase ("
-                "post_id TEXT PRIMARY KEY,"
-                "content TEXT,"
-                "author TEXT,"
-                "tags TEXT,"
-                "createdAT TEXT,"
-                "likesCount INT,"
-                "dislikesCount INT);")
-    conn.commit()
-    cur.close()
+    with pool.connection() as conn:
+        cur = conn.cursor()
+        execute(cur, 'lock_author_timeline',
+                """SELECT pg_advisory_xact_lock(%s, hashtext(%s));""", (TIMELINE_LOCK_ID, friend_to_login))
+        execute(cur, 'remove_friend',
+                """DELETE FROM FriendsDatabase WHERE friend_from_login = %s AND friend_to_login = %s;""",
+                (friend_from_login, friend_to_login))
+        execute(cur, 'remove_from_home_timeline',
+                """DELETE FROM HomeTimeline WHERE owner = %s AND author = %s;""", (friend_from_login, friend_to_login))
+        conn.commit()
+        cur.close()
 
 
 def insert_new_post(post_id: str, content: str, author: str,
                     tags: list, createdAt: str):
-    cur = conn.cursor()
-    cur.execute(f"""INSERT INTO PostsDatabase (post_id, content, author, tags, createdAt, likesCount, dislikesCount) 
-    VALUES ('{post_id}', '{content}', '{author}', '[{', '.join(f'"{tag}"' for tag in tags)}]', '{createdAt}', 0, 0)""")
-    conn.commit()
-    cur.close()
+    with pool.connection() as conn:
+        cur = conn.cursor()
+        execute(cur, 'lock_author_timeline_shared',
+                """SELECT pg_advisory_xact_lock_shared(%s, hashtext(%s));""", (TIMELINE_LOCK_ID, author))
+        execute(cur, 'get_fan_out_on_read', """SELECT fanOutOnRead FROM UsersDatabase WHERE login = %s;""", (author,))
+        fan_out_on_read = cur.fetchone()[0]
+        if not fan_out_on_read:
+            execute(cur, 'count_followers',
+                    """SELECT count(*) FROM (SELECT 1 FROM FriendsDatabase WHERE friend_to_login = %s LIMIT %s) f;""",
+                    (author, timeline_settings['fan_out_limit'] + 1))
+            if cur.fetchone()[0] > timeline_settings['fan_out_limit']:
+                fan_out_on_read = True
+                execute(cur, 'set_fan_out_on_read',
+                        """UPDATE UsersDatabase SET fanOutOnRead = TRUE WHERE login = %s;""", (author,))
+        execute(cur, 'insert_post',
+                """INSERT INTO PostsDatabase (post_id, content, author, tags, createdAt, likesCount, dislikesCount,
+                                              fannedOut)
+                   VALUES (%s, %s, %s, %s::TEXT[], %s, 0, 0, %s);""",
+                (post_id, content, author, tags, createdAt, not fan_out_on_read))
+        if not fan_out_on_read:
+            execute(cur, 'fan_out_post',
+                    """INSERT INTO HomeTimeline (owner, post_id, author, createdAt)
+                       SELECT friend_from_login, %s, %s, %s::TIMESTAMPTZ FROM FriendsDatabase
+                       WHERE friend_to_login = %s;""", (post_id, author, createdAt, author))
+        if tags:
+            execute(cur, 'count_post_tags',
+                    """INSERT INTO TagCounts (tag, bucket, postsCount)
+                       SELECT tag, date_trunc('hour', %s::TIMESTAMPTZ), 1
+                       FROM (SELECT DISTINCT unnest(%s::TEXT[]) AS tag) t ORDER BY tag
+                       ON CONFLICT (bucket, tag) DO UPDATE SET postsCount = TagCounts.postsCount + 1;""",
+                    (createdAt, tags))
+        conn.commit()
+        cur.close()
+
+
+def make_post(row) -> dict:
+    return {
+        "post_id": row[0],
+        "content": row[1],
+        "author": row[2],
+        "tags": row[3],
+        "createdAt": format_datetime(row[4]),
+        "likesCount": row[5],
+        "dislikesCount": row[6]
+        }
 
 
 def get_post_from_db(post_id: str):
-    cur = conn.cursor()
-    cur.execute(f"""SELECT content, author, tags, createdAt, likesCount, dislikesCount
-     FROM PostsDatabase WHERE post_id='{post_id}'""")
-    s = cur.fetchone()
-    conn.commit()
-    cur.close()
-    if s:
-        res = {
-            "post_id": post_id,
-            "content": s[0],
-            "author": s[1],
-            "tags": eval(s[2]),
-            "createdAt": s[3],
-            "likesCount": s[4],
-            "dislikesCount": s[5]
-            }
-        return res
-    return None
-
-
-def get_feed_by_author(author: str, offset=0, limit=0):
-    cur = conn.cursor()
-    if limit <= 0:
-        cur.execute(f"""SELECT post_id, content, author, tags, createdAt, likesCount, dislikesCount
-         FROM PostsDatabase WHERE author='{author}' ORDER BY post_id OFFSET {offset}""")
-    else:
-        cur.execute(f"""SELECT post_id, content, author, tags, createdAt, likesCount, dislikesCount
-                 FROM PostsDatabase WHERE author='{author}' ORDER BY post_id LIMIT {limit} OFFSET {offset}""")
-    s = cur.fetchall()
-    conn.commit()
-    cur.close()
-    if s:
-        res = []
-        for i in s:
-            res.append({
-                "post_id": i[0],
-                "content": i[1],
-                "author": i[2],
-                "tags": eval(i[3]),
-                "createdAt": i[4],
-                "likesCount": i[5],
-                "dislikesCount": i[6]
-                })
-        return sorted(res, key=lambda x: x['createdAt'], reverse=True)
-    return []
-
-
-def create_posts_reaction_database():
-    cur = conn.cursor()
-    cur.execute('CREATE TABLE IF NOT EXISTS PostsReactionDatabase'
-                '(post_id TEXT,'
-                'login TEXT,'
-                'reaction TEXT);')
-    conn.commit()
-    cur.close()
-
-
-def get_reaction(post_id, login):
-    cur = conn.cursor()
-    cur.execute(f"""SELECT reaction FROM PostsReactionDatabase WHERE post_id='{post_id}' AND login='{login}';""")
-    s = cur.fetchone()
-    conn.commit()
-    cur.close()
-    if s:
-        return s[0]
-    return None
-
-
-def update_reaction(reaction, login, post_id):
-    cur = conn.cursor()
-    cur.execute(f"""UPDATE PostsReactionDatabase SET reaction='{reaction}' 
-                    WHERE post_id='{post_id}' AND login='{login}';""")
-    conn.commit()
-    cur.close()
-
-
-def insert_reaction(reaction, login, post_id):
-    cur = conn.cursor()
-    cur.execute(f"""INSERT INTO PostsReactionDatabase (reaction, login, post_id) 
-                    VALUES ('{reaction}', '{login}', '{post_id}');""")
-    conn.commit()
-    cur.close()
-    
-
-def update_posts_counts(post_id, likesCount, dislikesCount):
-    cur = conn.cursor()
-    cur.execute(f"""UPDATE PostsDatabase SET likesCount='{likesCount}', dislikesCount='{dislikesCount}'
-                    WHERE post_id='{post_id}'""")
-    conn.commit()
-    cur.close()
-
-
-create_users_database()
-create_friends_database()
-create_posts_database()
-create_posts_reaction_database()
+    with pool.connection() as conn:
+        cur = conn.cursor()
+        execute(cur, 'get_post',
+                """SELECT post_id, content, author, tags, createdAt, likesCount, dislikesCount
+                   FROM PostsDatabase WHERE post_id = %s;""", (post_id,))
+        s = cur.fetchone()
+        conn.commit()
+        cur.close()
+        if s:
+            return make_post(s)
+        return None
+
+
+def get_feed_page(author: str, limit: int, offset=0, after=None):
+    with pool.connection() as conn:
+        cur = conn.cursor()
+        if after:
+            execute(cur, 'get_feed_page_after',
+                    """SELECT post_id, content, author, tags, createdAt, likesCount, dislikesCount
+                       FROM PostsDatabase WHERE author = %s AND (createdAt, post_id) < (%s, %s)
+                       ORDER BY createdAt DESC, post_id DESC LIMIT %s;""", (author, after[0], after[1], limit))
+        else:
+            execute(cur, 'get_feed_page',
+                    """SELECT post_id, content, author, tags, createdAt, likesCount, dislikesCount
+                       FROM PostsDatabase WHERE author = %s
+                       ORDER BY createdAt DESC, post_id DESC LIMIT %s OFFSET %s;""", (author, limit, offset))
+        s = cur.fetchall()
+        conn.commit()
+        cur.close()
+        res = [make_post(i) for i in s]
+        next_key = (s[-1][4], s[-1][0]) if s and len(s) == limit else None
+        return res, next_key
+
+
+def get_home_timeline(owner: str, limit: int, after=None):
+    after = after or (None, None)
+    with pool.connection() as conn:
+        cur = conn.cursor()
+        execute(cur, 'get_home_timeline',
+                """SELECT p.post_id, p.content, p.author, p.tags, p.createdAt, p.likesCount, p.dislikesCount
+                   FROM HomeTimeline h JOIN PostsDatabase p ON p.post_id = h.post_id
+                   WHERE h.owner = %(owner)s
+                     AND (%(created_at)s::TIMESTAMPTZ IS NULL
+                          OR (h.createdAt, h.post_id) < (%(created_at)s, %(post_id)s))
+                   ORDER BY h.createdAt DESC, h.post_id DESC LIMIT %(limit)s;""",
+                {'owner': owner, 'created_at': after[0], 'post_id': after[1], 'limit': limit})
+        materialized = cur.fetchall()
+        execute(cur, 'get_fanned_in_posts',
+                """SELECT p.post_id, p.content, p.author, p.tags, p.createdAt, p.likesCount, p.dislikesCount
+                   FROM FriendsDatabase f
+                   JOIN UsersDatabase u ON u.login = f.friend_to_login AND u.fanOutOnRead
+                   CROSS JOIN LATERAL (
+                       SELECT * FROM PostsDatabase p
+                       WHERE p.author = f.friend_to_login AND NOT p.fannedOut
+                         AND (%(created_at)s::TIMESTAMPTZ IS NULL
+                              OR (p.createdAt, p.post_id) < (%(created_at)s, %(post_id)s))
+                       ORDER BY p.createdAt DESC, p.post_id DESC LIMIT %(limit)s) p
+                   WHERE f.friend_from_login = %(owner)s
+                   ORDER BY p.author, p.createdAt DESC, p.post_id DESC;""",
+                {'owner': owner, 'created_at': after[0], 'post_id': after[1], 'limit': limit})
+        fanned_in = [list(rows) for _, rows in groupby(cur.fetchall(), key=lambda row: row[2])]
+        conn.commit()
+        cur.close()
+        s = list(islice(heapq.merge(materialized, *fanned_in, key=lambda row: (row[4], row[0]), reverse=True), limit))
+        next_key = (s[-1][4], s[-1][0]) if s and len(s) == limit else None
+        return [make_post(i) for i in s], next_key
+
+
+def search_posts_by_tag(viewer: str, tag: str, limit: int, after=None):
+    after = after or (None, None)
+    with pool.connection() as conn:
+        cur = conn.cursor()
+        execute(cur, 'search_posts_by_tag',
+                f"""SELECT p.post_id, p.content, p.author, p.tags, p.createdAt, p.likesCount, p.dislikesCount
+                    FROM PostsDatabase p JOIN UsersDatabase u ON u.login = p.author
+                    WHERE p.tags @> ARRAY[%(tag)s]::TEXT[] AND {VISIBLE_TO_VIEWER}
+                      AND (%(created_at)s::TIMESTAMPTZ IS NULL
+                           OR (p.createdAt, p.post_id) < (%(created_at)s, %(post_id)s))
+                    ORDER BY p.createdAt DESC, p.post_id DESC LIMIT %(limit)s;""",
+                {'viewer': viewer, 'tag': tag, 'created_at': after[0], 'post_id': after[1], 'limit': limit})
+        s = cur.fetchall()
+        conn.commit()
+        cur.close()
+        next_key = (s[-1][4], s[-1][0]) if s and len(s) == limit else None
+        return [make_post(i) for i in s], next_key
+
+
+def search_posts_by_text(viewer: str, q: str, limit: int, tag=None, after=None):
+    after = after or (None, None, None)
+    with pool.connection() as conn:
+        cur = conn.cursor()
+        execute(cur, 'search_posts_by_text',
+                f"""SELECT post_id, content, author, tags, createdAt, likesCount, dislikesCount, rank FROM (
+                        SELECT p.*, ts_rank(p.searchVector, query) AS rank
+                        FROM PostsDatabase p JOIN UsersDatabase u ON u.login = p.author,
+                             websearch_to_tsquery('russian', %(q)s) query
+                        WHERE p.searchVector @@ query AND {VISIBLE_TO_VIEWER}
+                          AND (%(tag)s::TEXT IS NULL OR p.tags @> ARRAY[%(tag)s]::TEXT[])) r
+                    WHERE (%(rank)s::REAL IS NULL
+                           OR (rank, createdAt, post_id) < (%(rank)s::REAL, %(created_at)s, %(post_id)s))
+                    ORDER BY rank DESC, createdAt DESC, post_id DESC LIMIT %(limit)s;""",
+                {'viewer': viewer, 'q': q, 'tag': tag, 'rank': after[0], 'created_at': after[1],
+                 'post_id': after[2], 'limit': limit})
+        s = cur.fetchall()
+        conn.commit()
+        cur.close()
+        next_key = (s[-1][7], s[-1][4], s[-1][0]) if s and len(s) == limit else None
+        return [make_post(i) for i in s], next_key
+
+
+def get_trending_tags(limit: int):
+    with pool.connection() as conn:
+        cur = conn.cursor()
+        execute(cur, 'get_trending_tags',
+                """SELECT tag, sum(postsCount) AS postsCount FROM TagCounts
+                   WHERE bucket >= date_trunc('hour', now()) - make_interval(hours => %s)
+                   GROUP BY tag ORDER BY postsCount DESC, tag LIMIT %s;""",
+                (tags_settings['trending_window_hours'], limit))
+        s = cur.fetchall()
+        conn.commit()
+        cur.close()
+        return [{'tag': i[0], 'postsCount': int(i[1])} for i in s]
+
+
+def upsert_reaction(cur, post_id, login, reaction):
+    while True:
+        execute(cur, 'lock_reaction',
+                """SELECT reaction FROM PostsReactionDatabase WHERE post_id = %s AND login = %s FOR UPDATE;""",
+                (post_id, login))
+        s = cur.fetchone()
+        if s:
+            if s[0] != reaction:
+                execute(cur, 'update_reaction',
+                        """UPDATE PostsReactionDatabase SET reaction = %s WHERE post_id = %s AND login = %s;""",
+                        (reaction, post_id, login))
+            return s[0]
+        execute(cur, 'insert_reaction',
+                """INSERT INTO PostsReactionDatabase (post_id, login, reaction) VALUES (%s, %s, %s)
+                   ON CONFLICT (post_id, login) DO NOTHING RETURNING reaction;""", (post_id, login, reaction))
+        if cur.fetchone():
+            return None
+
+
+def react_to_post(post_id, login, reaction):
+    with pool.connection() as conn:
+        cur = conn.cursor()
+        previous = upsert_reaction(cur, post_id, login, reaction)
+        likes, dislikes = reaction_delta(previous, reaction)
+        if likes or dislikes:
+            execute(cur, 'apply_reaction_delta',
+                    """UPDATE PostsDatabase
+                       SET likesCount = likesCount + %s, dislikesCount = dislikesCount + %s WHERE post_id = %s
+                       RETURNING post_id, content, author, tags, createdAt, likesCount, dislikesCount;""",
+                    (likes, dislikes, post_id))
+        else:
+            execute(cur, 'get_post',
+                    """SELECT post_id, content, author, tags, createdAt, likesCount, dislikesCount
+                       FROM PostsDatabase WHERE post_id = %s;""", (post_id,))
+        s = cur.fetchone()
+        conn.commit()
+        cur.close()
+        if s:
+            return make_post(s)
+        return None
+
+
+def record_reaction(post_id, login, reaction):
+    with pool.connection() as conn:
+        cur = conn.cursor()
+        previous = upsert_reaction(cur, post_id, login, reaction)
+        execute(cur, 'get_post',
+                """SELECT post_id, content, author, tags, createdAt, likesCount, dislikesCount
+                   FROM PostsDatabase WHERE post_id = %s;""", (post_id,))
+        s = cur.fetchone()
+        conn.commit()
+        cur.close()
+        return previous, make_post(s) if s else None
+
+
+def apply_counter_deltas(deltas: dict):
+    if not deltas:
+        return
+    with pool.connection() as conn:
+        cur = conn.cursor()
+        sql = """UPDATE PostsDatabase p
+                 SET likesCount = p.likesCount + d.likes, dislikesCount = p.dislikesCount + d.dislikes
+                 FROM (VALUES %s) AS d (post_id, likes, dislikes) WHERE p.post_id = d.post_id;"""
+        with observed('apply_counter_deltas', sql):
+            execute_values(cur, sql,
+                           [(post_id, likes, dislikes) for post_id, (likes, dislikes) in sorted(deltas.items())],
+                           template='(%s, %s::INT, %s::INT)')
+        conn.commit()
+        cur.close()
@@ -0,0 +1,289 @@
+import heapq
+import re
+import threading
+from bisect import bisect_left, insort
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+from itertools import islice
+from pathlib import Path
+
+from .migrations import MIGRATIONS
+from .models import UserRecord
+from .records import USER_UPDATABLE_COLUMNS, format_datetime, reaction_delta
+
+WORD = re.compile(r'\w+')
+SEED_COUNTRIES = Path(__file__).resolve().parents[1] / 'tests' / 'init-database.sh'
+COUNTRY = re.compile(r"\('([^']*)','([A-Z]{2})','([A-Z]{3})','([^']*)'\)")
+
+
+def load_seed_countries(path: Path = SEED_COUNTRIES) -> list:
+    countries = []
+    if path.exists():
+        countries = [{'name': name, 'alpha2': alpha2, 'alpha3': alpha3, 'region': region}
+                     for name, alpha2, alpha3, region in COUNTRY.findall(path.read_text(encoding='utf-8'))]
+    if not countries:
+        raise ValueError(f'Нет списка стран: задайте STORAGE_MEMORY_COUNTRIES или положите {path}')
+    return countries
+
+
+def parse_datetime(value) -> datetime:
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value)
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return value
+
+
+def stem(word: str) -> str:
+    return word[:max(len(word) - 2, 3)]
+
+
+def descending(keys: list, after=None, offset=0):
+    end = bisect_left(keys, tuple(after)) if after else len(keys)
+    return (keys[i] for i in range(end - 1 - offset, -1, -1))
+
+
+class MemoryStorage:
+    def __init__(self, countries: list | None = None, trending_window_hours: int = 24):
+        self.trending_window_hours = trending_window_hours
+        self._lock = threading.RLock()
+        self._countries = [dict(country) for country in countries or ()]
+        self._users = {}
+        self._emails = {}
+        self._phones = {}
+        self._friends = {}
+        self._friend_keys = {}
+        self._posts = {}
+        self._author_keys = {}
+        self._tag_keys = {}
+        self._words = {}
+        self._tag_counts = {}
+        self._reactions = {}
+
+    def init_database(self) -> dict:
+        return {'attempts': 1, 'applied': [], 'schema_version': MIGRATIONS[-1][0], 'seconds': 0.0}
+
+    def close_database(self):
+        pass
+
+    def pool_stats(self) -> dict | None:
+        return None
+
+    def get_countries(self) -> list:
+        with self._lock:
+            return [dict(country) for country in self._countries]
+
+    def check_user(self, login, email, phone):
+        with self._lock:
+            if login in self._users:
+                return 'login'
+            if email in self._emails:
+                return 'email'
+            if phone is not None and phone in self._phones:
+                return 'phone'
+            return None
+
+    def register_user(self, login, email, hashed_password, countryCode, isPublic, phone, image):
+        with self._lock:
+            if self.check_user(login, email, phone):
+                raise ValueError(f'Пользователь {login} нарушает уникальность login, email или phone')
+            self._store_user(UserRecord(login, email, hashed_password, countryCode, isPublic, phone, image, 0))
+
+    def _store_user(self, user: UserRecord):
+        previous = self._users.get(user.login)
+        if previous is not None:
+            self._emails.pop(previous.email, None)
+            self._phones.pop(previous.phone, None)
+        self._users[user.login] = user
+        self._emails[user.email] = user.login
+        if user.phone is not None:
+            self._phones[user.phone] = user.login
+
+    def get_user_from_db(self, login: str) -> UserRecord | None:
+        return self._users.get(login)
+
+    def update_user_profile(self, login, **kwargs):
+        if not set(kwargs) <= USER_UPDATABLE_COLUMNS:
+            raise ValueError(f'Unknown user columns: {set(kwargs) - USER_UPDATABLE_COLUMNS}')
+        with self._lock:
+            user = self._users.get(login)
+            if user is None or not kwargs:
+                return
+            self._store_user(user._replace(**kwargs))
+
+    def update_user_password(self, login, hashed_password):
+        with self._lock:
+            user = self._users.get(login)
+            if user is not None:
+                self._store_user(user._replace(hashed_password=hashed_password, tokenVersion=user.tokenVersion + 1))
+
+    def check_user_for_update(self, login, phone):
+        if not phone:
+            return None
+        with self._lock:
+            return 'phone' if self._phones.get(phone, login) != login else None
+
+    def check_friendship(self, friend_from_login, friend_to_login) -> bool:
+        with self._lock:
+            return friend_to_login in self._friends.get(friend_from_login, ())
+
+    def _can_view(self, viewer, user: UserRecord) -> bool:
+        return user.login == viewer or user.isPublic is True or viewer in self._friends.get(user.login, ())
+
+    def get_visibility(self, viewer, authors) -> dict:
+        with self._lock:
+            return {author: self._can_view(viewer, self._users[author]) for author in authors
+                    if author in self._users}
+
+    def get_friends_page(self, friend_from_login, limit, offset=0, after=None):
+        with self._lock:
+            keys = self._friend_keys.get(friend_from_login, [])
+            s = list(islice(descending(keys, after, 0 if after else offset), limit))
+        res = [{'login': login, 'addedAt': format_datetime(added_at)} for added_at, login in s]
+        next_key = s[-1] if s and len(s) == limit else None
+        return res, next_key
+
+    def add_friend_to_database(self, friend_from_login, friend_to_login, addedAt):
+        with self._lock:
+            friends = self._friends.setdefault(friend_from_login, {})
+            if friend_to_login not in friends:
+                friends[friend_to_login] = parse_datetime(addedAt)
+                insort(self._friend_keys.setdefault(friend_from_login, []),
+                       (friends[friend_to_login], friend_to_login))
+
+    def remove_friend_from_database(self, friend_from_login, friend_to_login):
+        with self._lock:
+            added_at = self._friends.get(friend_from_login, {}).pop(friend_to_login, None)
+            if added_at is not None:
+                keys = self._friend_keys[friend_from_login]
+                del keys[bisect_left(keys, (added_at, friend_to_login))]
+
+    def insert_new_post(self, post_id: str, content: str, author: str, tags: list, createdAt: str):
+        created_at = parse_datetime(createdAt)
+        key = (created_at, post_id)
+        with self._lock:
+            self._posts[post_id] = {
+                'post_id': post_id,
+                'content': content,
+                'author': author,
+                'tags': list(tags),
+                'createdAt': created_at,
+                'likesCount': 0,
+                'dislikesCount': 0,
+                'words': Counter(WORD.findall(content.lower()))
+            }
+            insort(self._author_keys.setdefault(author, []), key)
+            for tag in set(tags):
+                insort(self._tag_keys.setdefault(tag, []), key)
+            for word in self._posts[post_id]['words']:
+                self._words.setdefault(word, set()).add(post_id)
+            bucket = created_at.replace(minute=0, second=0, microsecond=0)
+            self._tag_counts.setdefault(bucket, Counter()).update(set(tags))
+
+    def _make_post(self, post_id: str) -> dict:
+        post = self._posts[post_id]
+        return {
+            'post_id': post['post_id'],
+            'content': post['content'],
+            'author': post['author'],
+            'tags': list(post['tags']),
+            'createdAt': format_datetime(post['createdAt']),
+            'likesCount': post['likesCount'],
+            'dislikesCount': post['dislikesCount']
+        }
+
+    def get_post_from_db(self, post_id: str):
+        with self._lock:
+            return self._make_post(post_id) if post_id in self._posts else None
+
+    def get_feed_page(self, author: str, limit: int, offset=0, after=None):
+        with self._lock:
+            keys = self._author_keys.get(author, [])
+            s = list(islice(descending(keys, after, 0 if after else offset), limit))
+            res = [self._make_post(post_id) for _, post_id in s]
+        next_key = s[-1] if s and len(s) == limit else None
+        return res, next_key
+
+    def get_home_timeline(self, owner: str, limit: int, after=None):
+        with self._lock:
+            feeds = [descending(self._author_keys.get(author, []), after) for author in self._friends.get(owner, ())]
+            s = list(islice(heapq.merge(*feeds, reverse=True), limit))
+            res = [self._make_post(post_id) for _, post_id in s]
+        next_key = s[-1] if s and len(s) == limit else None
+        return res, next_key
+
+    def search_posts_by_tag(self, viewer: str, tag: str, limit: int, after=None):
+        with self._lock:
+            keys = self._tag_keys.get(tag, [])
+            s = list(islice((key for key in descending(keys, after)
+                             if self._can_view(viewer, self._users[self._posts[key[1]]['author']])), limit))
+            res = [self._make_post(post_id) for _, post_id in s]
+        next_key = s[-1] if s and len(s) == limit else None
+        return res, next_key
+
+    def search_posts_by_text(self, viewer: str, q: str, limit: int, tag=None, after=None):
+        stems = {stem(word) for word in WORD.findall(q.lower())}
+        with self._lock:
+            matches = None
+            for prefix in stems:
+                found = set()
+                for word, post_ids in self._words.items():
+                    if word.startswith(prefix):
+                        found |= post_ids
+                matches = found if matches is None else matches & found
+            ranked = []
+            for post_id in matches or ():
+                post = self._posts[post_id]
+                if tag is not None and tag not in post['tags']:
+                    continue
+                if not self._can_view(viewer, self._users[post['author']]):
+                    continue
+                rank = float(sum(count for word, count in post['words'].items()
+                                 if any(word.startswith(prefix) for prefix in stems)))
+                key = (rank, post['createdAt'], post_id)
+                if after is None or key < tuple(after):
+                    ranked.append(key)
+            s = heapq.nlargest(limit, ranked)
+            res = [self._make_post(post_id) for _, _, post_id in s]
+        next_key = s[-1] if s and len(s) == limit else None
+        return res, next_key
+
+    def get_trending_tags(self, limit: int):
+        now = datetime.now(timezone.utc).replace(minute=0, second=0, microsecond=0)
+        since = now - timedelta(hours=self.trending_window_hours)
+        totals = Counter()
+        with self._lock:
+            for bucket, counts in self._tag_counts.items():
+                if bucket >= since:
+                    totals.update(counts)
+        s = sorted(totals.items(), key=lambda item: (-item[1], item[0]))[:limit]
+        return [{'tag': tag, 'postsCount': count} for tag, count in s]
+
+    def _upsert_reaction(self, post_id, login, reaction):
+        previous = self._reactions.get((post_id, login))
+        self._reactions[(post_id, login)] = reaction
+        return previous
+
+    def react_to_post(self, post_id, login, reaction):
+        with self._lock:
+            post = self._posts.get(post_id)
+            if post is None:
+                return None
+            likes, dislikes = reaction_delta(self._upsert_reaction(post_id, login, reaction), reaction)
+            post['likesCount'] += likes
+            post['dislikesCount'] += dislikes
+            return self._make_post(post_id)
+
+    def record_reaction(self, post_id, login, reaction):
+        with self._lock:
+            if post_id not in self._posts:
+                return None, None
+            return self._upsert_reaction(post_id, login, reaction), self._make_post(post_id)
+
+    def apply_counter_deltas(self, deltas: dict):
+        with self._lock:
+            for post_id, (likes, dislikes) in deltas.items():
+                post = self._posts.get(post_id)
+                if post is not None:
+                    post['likesCount'] += likes
+                    post['dislikesCount'] += dislikes
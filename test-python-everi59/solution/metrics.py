@@ -0,0 +1,164 @@
+import threading
+import time
+from bisect import bisect_left
+from contextvars import ContextVar
+
+from .config import load_metrics_configs
+from .statements import observers
+
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 8, 13, 21, 34)
+POOL_GAUGES = (('size', 'Open database connections.'),
+               ('max_size', 'Configured upper bound of open database connections.'),
+               ('idle', 'Open database connections waiting in the pool.'),
+               ('in_use', 'Database connections checked out by requests.'),
+               ('waiting', 'Requests waiting for a free database connection.'),
+               ('max_in_use', 'Highest number of connections checked out at once.'),
+               ('saturation', 'Share of max_size currently checked out.'))
+POOL_COUNTERS = (('acquired_total', 'Database connections handed out by the pool.'),
+                 ('waits_total', 'Checkouts that had to wait for a free connection.'),
+                 ('wait_seconds_total', 'Time spent waiting for a free connection.'),
+                 ('timeouts_total', 'Checkouts that gave up after the pool timeout.'),
+                 ('reconnects_total', 'Connections replaced after a failed health check.'))
+current_queries = ContextVar('current_queries', default=None)
+
+
+def escape(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def format_labels(names: tuple, values: tuple, **extra) -> str:
+    pairs = [f'{name}="{escape(value)}"' for name, value in (*zip(names, values), *extra.items())]
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+class Histogram:
+    def __init__(self, name: str, documentation: str, labels: tuple, buckets):
+        self.name = name
+        self.documentation = documentation
+        self.labels = labels
+        self.buckets = tuple(buckets)
+        self._series = {}
+
+    def observe(self, labels: tuple, value: float):
+        series = self._series.get(labels)
+        if series is None:
+            series = self._series[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+        series[0][bisect_left(self.buckets, value)] += 1
+        series[1] += value
+
+    def render(self) -> list:
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} histogram']
+        for labels, (counts, total) in sorted(self._series.items()):
+            cumulative = 0
+            for bound, count in zip((*self.buckets, '+Inf'), counts):
+                cumulative += count
+                lines.append(f'{self.name}_bucket{format_labels(self.labels, labels, le=bound)} {cumulative}')
+            lines.append(f'{self.name}_sum{format_labels(self.labels, labels)} {total}')
+            lines.append(f'{self.name}_count{format_labels(self.labels, labels)} {cumulative}')
+        return lines
+
+
+class Counter:
+    def __init__(self, name: str, documentation: str, labels: tuple):
+        self.name = name
+        self.documentation = documentation
+        self.labels = labels
+        self._series = {}
+
+    def inc(self, labels: tuple, value: float = 1):
+        self._series[labels] = self._series.get(labels, 0) + value
+
+    def render(self) -> list:
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} counter']
+        for labels, value in sorted(self._series.items()):
+            lines.append(f'{self.name}{format_labels(self.labels, labels)} {value}')
+        return lines
+
+
+class Metrics:
+    def __init__(self, enabled: bool, buckets):
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self.request_duration = Histogram('http_request_duration_seconds', 'HTTP request latency by route.',
+                                          ('method', 'route'), buckets)
+        self.requests = Counter('http_requests_total', 'HTTP responses by route and status.',
+                                ('method', 'route', 'status'))
+        self.request_queries = Histogram('http_request_db_queries', 'Database queries issued per request.',
+                                         ('route',), QUERY_COUNT_BUCKETS)
+        self.request_db_duration = Histogram('http_request_db_duration_seconds',
+                                             'Time per request spent in database queries.', ('route',), buckets)
+        self.query_duration = Histogram('db_query_duration_seconds', 'Database query latency by statement name.',
+                                        ('query',), buckets)
+        self.hash_duration = Histogram('password_hash_duration_seconds', 'Password hashing latency by operation.',
+                                       ('operation',), buckets)
+
+    def observe_query(self, name: str, sql: str, seconds: float):
+        queries = current_queries.get()
+        if queries is not None:
+            queries.append((name, seconds))
+        with self._lock:
+            self.query_duration.observe((name,), seconds)
+
+    def observe_hash(self, operation: str, seconds: float):
+        with self._lock:
+            self.hash_duration.observe((operation,), seconds)
+
+    def observe_request(self, method: str, route: str, status: int, seconds: float, queries: list):
+        with self._lock:
+            self.request_duration.observe((method, route), seconds)
+            self.requests.inc((method, route, str(status)))
+            self.request_queries.observe((route,), len(queries))
+            self.request_db_duration.observe((route,), sum(elapsed for _, elapsed in queries))
+
+    def render(self, pool_stats: dict | None = None) -> str:
+        with self._lock:
+            lines = []
+            for metric in (self.request_duration, self.requests, self.request_queries, self.request_db_duration,
+                           self.query_duration, self.hash_duration):
+                lines.extend(metric.render())
+        if pool_stats is not None:
+            lines.extend(render_pool_stats(pool_stats))
+        return '\n'.join(lines) + '\n'
+
+
+def render_pool_stats(stats: dict) -> list:
+    lines = []
+    for kind, series in (('gauge', POOL_GAUGES), ('counter', POOL_COUNTERS)):
+        for key, documentation in series:
+            name = f'db_pool_{key}'
+            lines.extend((f'# HELP {name} {documentation}', f'# TYPE {name} {kind}', f'{name} {stats[key]}'))
+    return lines
+
+
+class MetricsMiddleware:
+    def __init__(self, app, metrics: Metrics):
+        self.app = app
+        self.metrics = metrics
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+        started = time.perf_counter()
+        status_code = 500
+        queries = []
+        token = current_queries.set(queries)
+
+        async def send_with_status(message):
+            nonlocal status_code
+            if message['type'] == 'http.response.start':
+                status_code = message['status']
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            current_queries.reset(token)
+            route = scope.get('route')
+            self.metrics.observe_request(scope['method'], getattr(route, 'path', '<unmatched>'), status_code,
+                                         time.perf_counter() - started, queries)
+
+
+metrics = Metrics(**load_metrics_configs())
+if metrics.enabled:
+    observers.append(metrics.observe_query)
@@ -0,0 +1,183 @@
+MIGRATIONS_LOCK_ID = 5959001
+
+MIGRATIONS = [
+    (1, 'initial schema', [
+        """CREATE TABLE IF NOT EXISTS UsersDatabase
+           (login TEXT PRIMARY KEY,
+           email TEXT UNIQUE,
+           hashed_password TEXT,
+           countryCode TEXT,
+           isPublic BOOL,
+           phone TEXT UNIQUE,
+           image TEXT);""",
+        """CREATE TABLE IF NOT EXISTS FriendsDatabase
+           (friend_from_login TEXT,
+           friend_to_login TEXT,
+           addedAt TEXT);""",
+        """CREATE TABLE IF NOT EXISTS PostsDatabase
+           (post_id TEXT PRIMARY KEY,
+           content TEXT,
+           author TEXT,
+           tags TEXT,
+           createdAt TEXT,
+           likesCount INT,
+           dislikesCount INT);""",
+        """CREATE TABLE IF NOT EXISTS PostsReactionDatabase
+           (post_id TEXT,
+           login TEXT,
+           reaction TEXT);"""
+    ]),
+    (2, 'keys, indexes and typed columns for friends, posts and reactions', [
+        """DELETE FROM FriendsDatabase f
+           WHERE NOT EXISTS(SELECT 1 FROM UsersDatabase u WHERE u.login = f.friend_from_login)
+              OR NOT EXISTS(SELECT 1 FROM UsersDatabase u WHERE u.login = f.friend_to_login);""",
+        """DELETE FROM FriendsDatabase
+           WHERE ctid IN (SELECT ctid FROM (SELECT ctid, row_number() OVER (
+                              PARTITION BY friend_from_login, friend_to_login
+                              ORDER BY addedAt::timestamptz DESC NULLS LAST, ctid) AS n
+                          FROM FriendsDatabase) d
+                          WHERE n > 1);""",
+        """ALTER TABLE FriendsDatabase
+           ALTER COLUMN friend_from_login SET NOT NULL,
+           ALTER COLUMN friend_to_login SET NOT NULL,
+           ALTER COLUMN addedAt TYPE TIMESTAMPTZ USING addedAt::timestamptz,
+           ALTER COLUMN addedAt SET DEFAULT now(),
+           ALTER COLUMN addedAt SET NOT NULL,
+           ADD PRIMARY KEY (friend_from_login, friend_to_login),
+           ADD FOREIGN KEY (friend_from_login) REFERENCES UsersDatabase (login) ON DELETE CASCADE,
+           ADD FOREIGN KEY (friend_to_login) REFERENCES UsersDatabase (login) ON DELETE CASCADE;""",
+        """CREATE INDEX IF NOT EXISTS friends_to_login_idx ON FriendsDatabase (friend_to_login);""",
+        """DELETE FROM PostsDatabase p
+           WHERE NOT EXISTS(SELECT 1 FROM UsersDatabase u WHERE u.login = p.author);""",
+        """ALTER TABLE PostsDatabase
+           ALTER COLUMN author SET NOT NULL,
+           ALTER COLUMN createdAt TYPE TIMESTAMPTZ USING createdAt::timestamptz,
+           ALTER COLUMN createdAt SET DEFAULT now(),
+           ALTER COLUMN createdAt SET NOT NULL,
+           ALTER COLUMN tags TYPE TEXT[] USING CASE
+               WHEN tags IS NULL OR tags IN ('', '[]') THEN '{}'::TEXT[]
+               ELSE string_to_array(substr(tags, 3, length(tags) - 4), '", "')
+           END,
+           ALTER COLUMN tags SET DEFAULT '{}',
+           ALTER COLUMN tags SET NOT NULL,
+           ALTER COLUMN likesCount SET DEFAULT 0,
+           ALTER COLUMN dislikesCount SET DEFAULT 0,
+           ADD FOREIGN KEY (author) REFERENCES UsersDatabase (login) ON DELETE CASCADE;""",
+        """UPDATE PostsDatabase SET likesCount = coalesce(likesCount, 0), dislikesCount = coalesce(dislikesCount, 0)
+           WHERE likesCount IS NULL OR dislikesCount IS NULL;""",
+        """ALTER TABLE PostsDatabase
+           ALTER COLUMN likesCount SET NOT NULL,
+           ALTER COLUMN dislikesCount SET NOT NULL;""",
+        """CREATE INDEX IF NOT EXISTS posts_author_created_at_idx ON PostsDatabase (author, createdAt);""",
+        """DELETE FROM PostsReactionDatabase r
+           WHERE NOT EXISTS(SELECT 1 FROM PostsDatabase p WHERE p.post_id = r.post_id)
+              OR NOT EXISTS(SELECT 1 FROM UsersDatabase u WHERE u.login = r.login);""",
+        """DELETE FROM PostsReactionDatabase
+           WHERE ctid IN (SELECT ctid FROM (SELECT ctid, row_number() OVER (
+                              PARTITION BY post_id, login ORDER BY ctid DESC) AS n
+                          FROM PostsReactionDatabase) d
+                          WHERE n > 1);""",
+        """ALTER TABLE PostsReactionDatabase
+           ALTER COLUMN post_id SET NOT NULL,
+           ALTER COLUMN login SET NOT NULL,
+           ALTER COLUMN reaction SET NOT NULL,
+           ADD CHECK (reaction IN ('like', 'dislike')),
+           ADD PRIMARY KEY (post_id, login),
+           ADD FOREIGN KEY (post_id) REFERENCES PostsDatabase (post_id) ON DELETE CASCADE,
+           ADD FOREIGN KEY (login) REFERENCES UsersDatabase (login) ON DELETE CASCADE;""",
+        """CREATE INDEX IF NOT EXISTS reactions_login_idx ON PostsReactionDatabase (login);"""
+    ]),
+    (3, 'token version for stateless sessions', [
+        """ALTER TABLE UsersDatabase ADD COLUMN IF NOT EXISTS tokenVersion INT NOT NULL DEFAULT 0;"""
+    ]),
+    (4, 'keyset pagination indexes', [
+        """CREATE INDEX IF NOT EXISTS friends_from_added_at_idx
+           ON FriendsDatabase (friend_from_login, addedAt, friend_to_login);""",
+        """CREATE INDEX IF NOT EXISTS posts_author_created_at_id_idx ON PostsDatabase (author, createdAt, post_id);""",
+        """DROP INDEX IF EXISTS posts_author_created_at_idx;"""
+    ]),
+    (5, 'materialized home timeline', [
+        """ALTER TABLE UsersDatabase ADD COLUMN IF NOT EXISTS fanOutOnRead BOOL NOT NULL DEFAULT FALSE;""",
+        """ALTER TABLE PostsDatabase ADD COLUMN IF NOT EXISTS fannedOut BOOL NOT NULL DEFAULT TRUE;""",
+        """CREATE TABLE IF NOT EXISTS HomeTimeline
+           (owner TEXT NOT NULL REFERENCES UsersDatabase (login) ON DELETE CASCADE,
+           post_id TEXT NOT NULL REFERENCES PostsDatabase (post_id) ON DELETE CASCADE,
+           author TEXT NOT NULL,
+           createdAt TIMESTAMPTZ NOT NULL,
+           PRIMARY KEY (owner, createdAt, post_id));""",
+        """CREATE INDEX IF NOT EXISTS home_timeline_owner_author_idx ON HomeTimeline (owner, author);""",
+        """CREATE INDEX IF NOT EXISTS home_timeline_post_id_idx ON HomeTimeline (post_id);""",
+        """UPDATE UsersDatabase u SET fanOutOnRead = TRUE
+           WHERE (SELECT count(*) FROM FriendsDatabase f WHERE f.friend_to_login = u.login) > %(fan_out_limit)s;""",
+        """UPDATE PostsDatabase p SET fannedOut = FALSE FROM UsersDatabase u WHERE u.login = p.author AND u.fanOutOnRead;""",
+        """INSERT INTO HomeTimeline (owner, post_id, author, createdAt)
+           SELECT f.friend_from_login, p.post_id, p.author, p.createdAt
+           FROM FriendsDatabase f JOIN PostsDatabase p ON p.author = f.friend_to_login
+           WHERE p.fannedOut ON CONFLICT DO NOTHING;""",
+        """CREATE INDEX IF NOT EXISTS posts_fan_out_on_read_idx ON PostsDatabase (author, createdAt, post_id)
+           WHERE NOT fannedOut;"""
+    ]),
+    (6, 'tag index and hourly tag counts', [
+        """CREATE INDEX IF NOT EXISTS posts_tags_idx ON PostsDatabase USING GIN (tags);""",
+        """CREATE TABLE IF NOT EXISTS TagCounts
+           (tag TEXT NOT NULL,
+           bucket TIMESTAMPTZ NOT NULL,
+           postsCount INT NOT NULL DEFAULT 0,
+           PRIMARY KEY (bucket, tag));""",
+        """INSERT INTO TagCounts (tag, bucket, postsCount)
+           SELECT t.tag, date_trunc('hour', p.createdAt), count(*)
+           FROM PostsDatabase p CROSS JOIN LATERAL (SELECT DISTINCT unnest(p.tags) AS tag) t
+           GROUP BY 1, 2 ON CONFLICT DO NOTHING;"""
+    ]),
+    (7, 'full-text search over post content', [
+        """ALTER TABLE PostsDatabase ADD COLUMN IF NOT EXISTS searchVector TSVECTOR
+           GENERATED ALWAYS AS (to_tsvector('russian', coalesce(content, ''))) STORED;""",
+        """CREATE INDEX IF NOT EXISTS posts_search_vector_idx ON PostsDatabase USING GIN (searchVector);"""
+    ]),
+    (8, 'NULL instead of the literal None for missing phone and image', [
+        """UPDATE UsersDatabase SET phone = NULL WHERE phone = 'None';""",
+        """UPDATE UsersDatabase SET image = NULL WHERE image = 'None';"""
+    ])
+]
+
+
+def get_schema_version(conn) -> int:
+    cur = conn.cursor()
+    cur.execute("""SELECT to_regclass('SchemaMigrations') IS NOT NULL;""")
+    if not cur.fetchone()[0]:
+        cur.close()
+        return 0
+    cur.execute("""SELECT coalesce(max(version), 0) FROM SchemaMigrations;""")
+    version = cur.fetchone()[0]
+    cur.close()
+    return version
+
+
+def migrate(conn, target: int | None = None, fan_out_limit: int = 1000) -> list:
+    applied = []
+    params = {'fan_out_limit': fan_out_limit}
+    latest = MIGRATIONS[-1][0] if target is None else target
+    if get_schema_version(conn) >= latest:
+        conn.commit()
+        return applied
+    for version, name, statements in MIGRATIONS:
+        if target is not None and version > target:
+            break
+        cur = conn.cursor()
+        cur.execute("""SELECT pg_advisory_xact_lock(%s);""", (MIGRATIONS_LOCK_ID,))
+        cur.execute("""CREATE TABLE IF NOT EXISTS SchemaMigrations
+                       (version INT PRIMARY KEY,
+                       name TEXT NOT NULL,
+                       appliedAt TIMESTAMPTZ NOT NULL DEFAULT now());""")
+        cur.execute("""SELECT EXISTS(SELECT 1 FROM SchemaMigrations WHERE version = %s);""", (version,))
+        if cur.fetchone()[0]:
+            conn.commit()
+            cur.close()
+            continue
+        for statement in statements:
+            cur.execute(statement, params)
+        cur.execute("""INSERT INTO SchemaMigrations (version, name) VALUES (%s, %s);""", (version, name))
+        conn.commit()
+        cur.close()
+        applied.append(version)
+    return applied
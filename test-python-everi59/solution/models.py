@@ -1,27 +1,14 @@
+from enum import Enum
 from pydantic import BaseModel
-from typing import Optional
+from typing import NamedTuple, Optional
 
 
-class Region(BaseModel):
-    name: Optional[str]
-
-
-class Token(BaseModel):
-    access_token: str
-    token_type: str
-
-
-class TokenData(BaseModel):
-    login: str | None = None
-
-
-class UserData(BaseModel):
-    login: str
-    email: str
-    countryCode: str
-    isPublic: bool
-    phone: Optional[str] = None
-    image: Optional[str] = None
+class Region(str, Enum):
+    europe = 'Europe'
+    africa = 'Africa'
+    americas = 'Americas'
+    oceania = 'Oceania'
+    asia = 'Asia'
 
 
 class UserUpdatedProfile(BaseModel):
@@ -41,10 +28,6 @@ class UserReg(BaseModel):
     image: Optional[str] = None
 
 
-class UserInDB(UserData):
-    hashed_password: str
-
-
 class FormData(BaseModel):
     login: str
     password: str
@@ -65,4 +48,28 @@ class RemoveFriend(BaseModel):
 
 class NewPost(BaseModel):
     content: str
-    tags: list
\ No newline at end of file
+    tags: list
+
+
+class UserRecord(NamedTuple):
+    login: str
+    email: str
+    hashed_password: str
+    countryCode: str
+    isPublic: bool
+    phone: str | None
+    image: str | None
+    tokenVersion: int
+
+    def profile(self) -> dict:
+        result = {
+            'login': self.login,
+            'email': self.email,
+            'countryCode': self.countryCode,
+            'isPublic': self.isPublic
+        }
+        if self.phone:
+            result['phone'] = self.phone
+        if self.image:
+            result['image'] = self.image
+        return result
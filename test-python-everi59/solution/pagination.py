@@ -0,0 +1,23 @@
+import base64
+import json
+from datetime import datetime
+
+
+def encode_cursor(key: tuple) -> str:
+    *rank, moment, ident = key
+    raw = json.dumps([*rank, moment.isoformat(), ident], separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor: str, size: int = 2) -> tuple:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        *rank, moment, ident = json.loads(raw)
+        moment = datetime.fromisoformat(moment)
+    except (ValueError, TypeError) as e:
+        raise ValueError('Некорректный cursor') from e
+    if len(rank) != size - 2 or not all(isinstance(value, (int, float)) for value in rank):
+        raise ValueError('Некорректный cursor')
+    if moment.tzinfo is None or not isinstance(ident, str):
+        raise ValueError('Некорректный cursor')
+    return *rank, moment, ident
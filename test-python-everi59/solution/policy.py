@@ -0,0 +1,29 @@
+from typing import Iterable
+
+from .storage import get_visibility
+from .service import is_friend
+
+
+class VisibilityPolicy:
+    def __init__(self, viewer: str):
+        self.viewer = viewer
+        self._memo = {viewer: True}
+
+    async def can_view(self, author: str, is_public: bool | None = None) -> bool:
+        if author not in self._memo:
+            if is_public:
+                self._memo[author] = True
+            elif is_public is False:
+                self._memo[author] = await is_friend(author, self.viewer)
+            else:
+                await self.can_view_many((author,))
+        return self._memo[author]
+
+    async def can_view_many(self, authors: Iterable[str]) -> dict[str, bool]:
+        authors = set(authors)
+        missing = authors - self._memo.keys()
+        if missing:
+            visible = await get_visibility(self.viewer, missing)
+            for author in missing:
+                self._memo[author] = visible.get(author, False)
+        return {author: self._memo[author] for author in authors}
@@ -0,0 +1,182 @@
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+import psycopg2
+from psycopg2 import extensions
+
+from .records import StorageUnavailable
+
+
+class PoolTimeout(StorageUnavailable):
+    pass
+
+
+class PreparingConnection(extensions.connection):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.prepared = set()
+
+
+class ConnectionPool:
+    def __init__(self, min_size: int, max_size: int, timeout: float, health_check_interval: float,
+                 **conn_kwargs):
+        if not 0 <= min_size <= max_size or max_size < 1:
+            raise ValueError('Некорректные размеры пула соединений!')
+        self.min_size = min_size
+        self.max_size = max_size
+        self.timeout = timeout
+        self.health_check_interval = health_check_interval
+        self._conn_kwargs = conn_kwargs
+        self._cond = threading.Condition()
+        self._idle = deque()
+        self._size = 0
+        self._in_use = 0
+        self._waiting = 0
+        self._max_in_use = 0
+        self._acquired_total = 0
+        self._waits_total = 0
+        self._wait_seconds_total = 0.0
+        self._timeouts_total = 0
+        self._reconnects_total = 0
+
+    def open(self):
+        with self._cond:
+            missing = max(self.min_size - self._size, 0)
+            self._size += missing
+        opened = []
+        try:
+            for _ in range(missing):
+                opened.append(self._connect())
+        except Exception:
+            for conn in opened:
+                self._close(conn)
+            with self._cond:
+                self._size -= missing
+                self._cond.notify_all()
+            raise
+        with self._cond:
+            self._idle.extend((conn, time.monotonic()) for conn in opened)
+            self._cond.notify_all()
+
+    def _connect(self):
+        return psycopg2.connect(**self._conn_kwargs)
+
+    def _is_healthy(self, conn, idle_since: float) -> bool:
+        if conn.closed:
+            return False
+        if time.monotonic() - idle_since < self.health_check_interval:
+            return True
+        try:
+            cur = conn.cursor()
+            cur.execute('SELECT 1')
+            cur.close()
+            conn.rollback()
+            return True
+        except psycopg2.Error:
+            return False
+
+    def getconn(self):
+        started = time.monotonic()
+        deadline = started + self.timeout
+        with self._cond:
+            waited = False
+            while not self._idle and self._size >= self.max_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._timeouts_total += 1
+                    raise PoolTimeout(f'Не удалось получить соединение с БД за {self.timeout} с')
+                waited = True
+                self._waiting += 1
+                try:
+                    self._cond.wait(remaining)
+                finally:
+                    self._waiting -= 1
+            if self._idle:
+                conn, idle_since = self._idle.pop()
+            else:
+                conn, idle_since = None, None
+                self._size += 1
+            self._in_use += 1
+            self._acquired_total += 1
+            self._max_in_use = max(self._max_in_use, self._in_use)
+            if waited:
+                self._waits_total += 1
+                self._wait_seconds_total += time.monotonic() - started
+        try:
+            if conn is None:
+                conn = self._connect()
+            elif not self._is_healthy(conn, idle_since):
+                self._close(conn)
+                conn = self._connect()
+                with self._cond:
+                    self._reconnects_total += 1
+        except Exception:
+            with self._cond:
+                self._size -= 1
+                self._in_use -= 1
+                self._cond.notify()
+            raise
+        return conn
+
+    def putconn(self, conn, discard: bool = False):
+        if not discard and not conn.closed:
+            try:
+                if conn.get_transaction_status() != extensions.TRANSACTION_STATUS_IDLE:
+                    conn.rollback()
+            except psycopg2.Error:
+                discard = True
+        if discard or conn.closed:
+            self._close(conn)
+        with self._cond:
+            self._in_use -= 1
+            if discard or conn.closed:
+                self._size -= 1
+            else:
+                self._idle.append((conn, time.monotonic()))
+            self._cond.notify()
+
+    @contextmanager
+    def connection(self):
+        conn = self.getconn()
+        discard = False
+        try:
+            yield conn
+        except (psycopg2.OperationalError, psycopg2.InterfaceError):
+            discard = True
+            raise
+        finally:
+            self.putconn(conn, discard=discard)
+
+    @staticmethod
+    def _close(conn):
+        try:
+            conn.close()
+        except psycopg2.Error:
+            pass
+
+    def closeall(self):
+        with self._cond:
+            while self._idle:
+                conn, _ = self._idle.pop()
+                self._close(conn)
+                self._size -= 1
+
+    def stats(self) -> dict:
+        with self._cond:
+            return {
+                'min_size': self.min_size,
+                'max_size': self.max_size,
+                'size': self._size,
+                'idle': len(self._idle),
+                'in_use': self._in_use,
+                'waiting': self._waiting,
+                'max_in_use': self._max_in_use,
+                'saturation': self._in_use / self.max_size,
+                'acquired_total': self._acquired_total,
+                'waits_total': self._waits_total,
+                'wait_seconds_total': self._wait_seconds_total,
+                'timeouts_total': self._timeouts_total,
+                'reconnects_total': self._reconnects_total
+            }
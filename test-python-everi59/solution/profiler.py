@@ -0,0 +1,235 @@
+import asyncio
+import functools
+import logging
+import sys
+import threading
+import time
+from collections import Counter
+from contextvars import ContextVar
+from pathlib import Path
+
+from .config import load_profiler_configs
+from .statements import observers
+
+SOURCE_DIR = str(Path(__file__).resolve().parent)
+current_profile = ContextVar('current_profile', default=None)
+
+
+class RequestProfile:
+    __slots__ = ('queries', 'task', 'task_thread', 'threads', 'samples')
+
+    def __init__(self, task=None):
+        self.queries = []
+        self.task = task
+        self.task_thread = threading.get_ident()
+        self.threads = set()
+        self.samples = Counter()
+
+
+def collapse_frames(frames: list) -> str:
+    stack = [f'{Path(frame.f_code.co_filename).name}:{frame.f_code.co_name}:{frame.f_lineno}'
+             for frame in frames if frame.f_code.co_filename.startswith(SOURCE_DIR)]
+    if frames and not frames[-1].f_code.co_filename.startswith(SOURCE_DIR):
+        stack.append(f'[{frames[-1].f_code.co_name}]')
+    return ' > '.join(stack)
+
+
+def thread_frames(frame) -> list:
+    frames = []
+    while frame is not None:
+        frames.append(frame)
+        frame = frame.f_back
+    return frames[::-1]
+
+
+def task_frames(task, frames_by_thread: dict, thread_id: int) -> list:
+    if task is None or task.done():
+        return []
+    if asyncio.current_task(task.get_loop()) is task:
+        return thread_frames(frames_by_thread.get(thread_id))
+    frames = []
+    coro = task.get_coro()
+    while coro is not None:
+        frame = getattr(coro, 'cr_frame', None) or getattr(coro, 'gi_frame', None)
+        if frame is None:
+            break
+        frames.append(frame)
+        coro = getattr(coro, 'cr_await', None) or getattr(coro, 'gi_yieldfrom', None)
+    return frames
+
+
+class Profiler:
+    def __init__(self, enabled: bool, max_queries: int, repeated_queries: int, slow_ms: float,
+                 sample_interval: float, top: int):
+        self.enabled = enabled
+        self.max_queries = max_queries
+        self.repeated_queries = repeated_queries
+        self.slow_ms = slow_ms
+        self.sample_interval = sample_interval
+        self.top = top
+        self._lock = threading.Lock()
+        self._active = set()
+        self._routes = {}
+        self._stop = threading.Event()
+        self._thread = None
+
+    def observe_query(self, name: str, sql: str, seconds: float):
+        profile = current_profile.get()
+        if profile is not None:
+            profile.queries.append((name, seconds))
+
+    def begin(self) -> RequestProfile:
+        try:
+            task = asyncio.current_task()
+        except RuntimeError:
+            task = None
+        profile = RequestProfile(task)
+        with self._lock:
+            self._active.add(profile)
+        return profile
+
+    def end(self, profile: RequestProfile, method: str, route: str, status: int, seconds: float) -> list:
+        with self._lock:
+            self._active.discard(profile)
+        counts = Counter(name for name, _ in profile.queries)
+        repeated = sorted(name for name, count in counts.items() if count >= self.repeated_queries)
+        reasons = []
+        if len(profile.queries) > self.max_queries:
+            reasons.append('queries')
+        if repeated:
+            reasons.append('n+1')
+        if seconds * 1000 > self.slow_ms:
+            reasons.append('slow')
+        key = f'{method} {route}'
+        with self._lock:
+            stats = self._routes.get(key)
+            if stats is None:
+                stats = self._routes[key] = {'requests': 0, 'flagged': 0, 'queries_total': 0, 'queries_max': 0,
+                                             'seconds_total': 0.0, 'seconds_max': 0.0, 'repeated': Counter(),
+                                             'last_flagged': None}
+            stats['requests'] += 1
+            stats['queries_total'] += len(profile.queries)
+            stats['queries_max'] = max(stats['queries_max'], len(profile.queries))
+            stats['seconds_total'] += seconds
+            stats['seconds_max'] = max(stats['seconds_max'], seconds)
+            if reasons:
+                stats['flagged'] += 1
+                stats['repeated'].update(repeated)
+                stats['last_flagged'] = {
+                    'status': status,
+                    'reasons': reasons,
+                    'ms': round(seconds * 1000, 3),
+                    'queries': [{'name': name, 'ms': round(elapsed * 1000, 3)}
+                                for name, elapsed in profile.queries],
+                    'stacks': [{'stack': stack, 'samples': count}
+                               for stack, count in profile.samples.most_common(5)]
+                }
+        if reasons:
+            details = [f'  {i}. {name} {elapsed * 1000:.3f} мс' for i, (name, elapsed) in enumerate(profile.queries, 1)]
+            details.extend(f'  {count} x {stack}' for stack, count in profile.samples.most_common(5))
+            logging.getLogger(__name__).warning(
+                'Запрос %s %s (%s): %.1f мс, %d запросов к БД%s%s', method, route, ', '.join(reasons),
+                seconds * 1000, len(profile.queries), f', повторяются: {", ".join(repeated)}' if repeated else '',
+                ''.join(f'\n{line}' for line in details))
+        return reasons
+
+    def report(self) -> list:
+        with self._lock:
+            routes = [(key, dict(stats, repeated=dict(stats['repeated']))) for key, stats in self._routes.items()]
+        rows = []
+        for key, stats in routes:
+            rows.append({
+                'route': key,
+                'requests': stats['requests'],
+                'flagged': stats['flagged'],
+                'queries_mean': round(stats['queries_total'] / stats['requests'], 2),
+                'queries_max': stats['queries_max'],
+                'ms_mean': round(stats['seconds_total'] / stats['requests'] * 1000, 3),
+                'ms_max': round(stats['seconds_max'] * 1000, 3),
+                'repeated_queries': stats['repeated'],
+                'last_flagged': stats['last_flagged']
+            })
+        rows.sort(key=lambda row: (-row['flagged'], -row['queries_mean'], -row['ms_mean']))
+        return rows[:self.top]
+
+    def reset(self):
+        with self._lock:
+            self._routes.clear()
+
+    def start(self):
+        if not self.enabled or self.sample_interval <= 0 or self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._sample_loop, name='debug-profiler', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _sample_loop(self):
+        while not self._stop.wait(self.sample_interval):
+            with self._lock:
+                active = list(self._active)
+            if not active:
+                continue
+            frames = sys._current_frames()
+            for profile in active:
+                awaiting = task_frames(profile.task, frames, profile.task_thread)
+                threads = [frames[thread_id] for thread_id in list(profile.threads) if thread_id in frames]
+                for frame in threads:
+                    profile.samples[collapse_frames(awaiting + thread_frames(frame))] += 1
+                if awaiting and not threads:
+                    profile.samples[collapse_frames(awaiting)] += 1
+
+
+def profiled(func):
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        profile = current_profile.get()
+        if profile is None:
+            return func(*args, **kwargs)
+        thread_id = threading.get_ident()
+        profile.threads.add(thread_id)
+        try:
+            return func(*args, **kwargs)
+        finally:
+            profile.threads.discard(thread_id)
+
+    return wrapper
+
+
+class ProfilerMiddleware:
+    def __init__(self, app, profiler: Profiler):
+        self.app = app
+        self.profiler = profiler
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+        started = time.perf_counter()
+        status_code = 500
+        profile = self.profiler.begin()
+        token = current_profile.set(profile)
+
+        async def send_with_status(message):
+            nonlocal status_code
+            if message['type'] == 'http.response.start':
+                status_code = message['status']
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            current_profile.reset(token)
+            route = scope.get('route')
+            self.profiler.end(profile, scope['method'], getattr(route, 'path', '<unmatched>'), status_code,
+                              time.perf_counter() - started)
+
+
+profiler = Profiler(**load_profiler_configs())
+if profiler.enabled:
+    observers.append(profiler.observe_query)
@@ -0,0 +1,16 @@
+from datetime import timezone
+
+USER_UPDATABLE_COLUMNS = {'email', 'hashed_password', 'countryCode', 'isPublic', 'phone', 'image'}
+
+
+class StorageUnavailable(Exception):
+    pass
+
+
+def format_datetime(value):
+    return value.astimezone(timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ')
+
+
+def reaction_delta(previous, reaction) -> tuple[int, int]:
+    return (int(reaction == 'like') - int(previous == 'like'),
+            int(reaction == 'dislike') - int(previous == 'dislike'))
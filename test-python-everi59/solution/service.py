@@ -1,28 +1,67 @@
+import asyncio
+import functools
+import time
 import jwt
 
+from concurrent.futures import ThreadPoolExecutor
 from passlib.context import CryptContext
+from passlib.registry import get_crypt_handler
 from fastapi.responses import JSONResponse
 from fastapi import status
 from datetime import datetime, timedelta
 
-from .config import SECRET_KEY, ALGORITHM
-from .models import UserInDB
-from .database import get_user_from_db, get_user_profile_from_db
+from .cache import LRUCache
+from .config import SECRET_KEY, ALGORITHM, load_concurrency_configs, load_auth_cache_configs, \
+    load_friendship_cache_configs, load_password_hashing_configs
+from .metrics import metrics
+from .models import UserRecord
+from .storage import get_user_from_db, update_user_profile, check_friendship, add_friend_to_database, \
+    remove_friend_from_database
+
+
+def make_crypt_context(schemes: list, default: str, rounds: int | None = None) -> CryptContext:
+    if default not in schemes:
+        schemes = [default, *schemes]
+    settings = {}
+    handler = get_crypt_handler(default)
+    if rounds is not None and 'rounds' in handler.setting_kwds:
+        if not handler.min_rounds <= rounds <= handler.max_rounds:
+            raise ValueError(f'{default} поддерживает rounds от {handler.min_rounds} до {handler.max_rounds}')
+        settings = {f'{default}__default_rounds': rounds, f'{default}__min_rounds': rounds,
+                    f'{default}__max_rounds': rounds}
+    return CryptContext(schemes=schemes, default=default, deprecated='auto', **settings)
+
+
+pwd_context = make_crypt_context(**load_password_hashing_configs())
+hash_executor = ThreadPoolExecutor(max_workers=load_concurrency_configs()['hash_workers'],
+                                   thread_name_prefix='password-hash')
+auth_cache = LRUCache(**load_auth_cache_configs())
+friendship_cache = LRUCache(**load_friendship_cache_configs())
+
+
+async def run_hashing(operation: str, func, *args):
+    loop = asyncio.get_running_loop()
+    started = time.perf_counter()
+    try:
+        return await loop.run_in_executor(hash_executor, functools.partial(func, *args))
+    finally:
+        if metrics.enabled:
+            metrics.observe_hash(operation, time.perf_counter() - started)
+
 
-pwd_context = CryptContext(schemes=["sha256_crypt", "md5_crypt", "des_crypt"],
-                           default="des_crypt", deprecated="auto")
+async def verify_password(plain_password, hashed_password):
+    return await run_hashing('verify', pwd_context.verify, plain_password, hashed_password)
 
 
-def verify_password(plain_password, hashed_password):
-    return pwd_context.verify(plain_password, hashed_password)
+async def verify_and_update_password(plain_password, hashed_password):
+    return await run_hashing('verify', pwd_context.verify_and_update, plain_password, hashed_password)
 
 
-def get_password_hash(password):
-    return pwd_context.hash(password)
+async def get_password_hash(password):
+    return await run_hashing('hash', pwd_context.hash, password)
 
 
-def authenticate_user(password: str, user_dict: str):
-    user = get_user(user_dict)
+async def authenticate_user(password: str, user: UserRecord | None):
     if not user:
         return JSONResponse(
             status_code=status.HTTP_401_UNAUTHORIZED,
@@ -30,34 +69,31 @@ def authenticate_user(password: str, user_dict: str):
                 'reason': 'Пользователь с указанным логином не найден!'
             }
         )
-    if not verify_password(password, user.hashed_password):
+    valid, new_hash = await verify_and_update_password(password, user.hashed_password)
+    if not valid:
         return JSONResponse(
             status_code=status.HTTP_401_UNAUTHORIZED,
             content={
                 'reason': 'Вы ввели неправильный пароль!'
             }
         )
+    if new_hash:
+        await update_user_profile(login=user.login, hashed_password=new_hash)
     return user
 
 
-def get_user(user_dict):
-    if user_dict:
-        return UserInDB(**user_dict)
-    return None
-
-
-def create_token(login: str, password: str):
+def create_token(login: str, token_version: int):
     expires_delta = timedelta(hours=6)
     expire = datetime.utcnow() + expires_delta
-    to_encode = {'login': login, 'password': password, 'exp': expire}
+    to_encode = {'login': login, 'ver': token_version, 'exp': expire}
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
 
 def get_token(token: str) -> dict | JSONResponse:
     try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=ALGORITHM)
-        return {'login': payload['login'], 'password': payload['password']}
+        payload = jwt.decode(token, SECRET_KEY, algorithms=ALGORITHM, options={'require': ['login', 'ver', 'exp']})
+        return {'login': payload['login'], 'ver': payload['ver'], 'exp': payload['exp']}
     except jwt.InvalidTokenError:
         return JSONResponse(
             status_code=status.HTTP_401_UNAUTHORIZED,
@@ -76,30 +112,63 @@ def check_valid_auth_bearer(authorization):
     return None
 
 
-def verify_token_data(user_data, token_data):
-    return (user_data['login'] == token_data['login'] and
-            verify_password(plain_password=token_data['password'], hashed_password=user_data['hashed_password']))
+def verify_token_data(user: UserRecord, token_data):
+    return user.login == token_data['login'] and user.tokenVersion == token_data['ver']
+
+
+def forget_user(login: str):
+    auth_cache.invalidate_group(login)
+
 
+async def is_friend(friend_from_login: str, friend_to_login: str) -> bool:
+    key = (friend_from_login, friend_to_login)
+    result = friendship_cache.get(key)
+    if result is None:
+        generation = friendship_cache.generation(key)
+        result = await check_friendship(friend_from_login, friend_to_login)
+        friendship_cache.set(key, result, group=key, generation=generation)
+    return result
 
-def token_data_validation(authorization):
+
+async def add_friend(friend_from_login: str, friend_to_login: str, addedAt: str):
+    await add_friend_to_database(friend_from_login=friend_from_login, friend_to_login=friend_to_login, addedAt=addedAt)
+    friendship_cache.invalidate_group((friend_from_login, friend_to_login))
+
+
+async def remove_friend(friend_from_login: str, friend_to_login: str):
+    await remove_friend_from_database(friend_from_login=friend_from_login, friend_to_login=friend_to_login)
+    friendship_cache.invalidate_group((friend_from_login, friend_to_login))
+
+
+async def token_user_validation(authorization) -> UserRecord | JSONResponse:
     check_bearer = check_valid_auth_bearer(authorization)
     if isinstance(check_bearer, JSONResponse):
         return check_bearer
     token = authorization[7:]
+    user = auth_cache.get(token)
+    if user is not None:
+        return user
     token_data = get_token(token)
     if isinstance(token_data, JSONResponse):
         return token_data
-    user_json = get_user_profile_from_db(login=token_data['login'])
-    user_data = get_user_from_db(login=token_data['login'])
-    if user_json is None or user_data is None:
+    generation = auth_cache.generation(token_data['login'])
+    user = await get_user_from_db(login=token_data['login'])
+    if user is None:
         return JSONResponse(
             status_code=status.HTTP_401_UNAUTHORIZED,
             content={'reason': 'Данные токена устарели или не верны!'}
         )
-    if not verify_token_data(user_data=user_data, token_data=token_data):
+    if not verify_token_data(user=user, token_data=token_data):
         return JSONResponse(
             status_code=status.HTTP_401_UNAUTHORIZED,
             content={'reason': 'Данные токена не верны!'}
         )
-    return user_json
+    auth_cache.set(token, user, ttl=token_data['exp'] - time.time(), group=user.login, generation=generation)
+    return user
+
 
+async def token_data_validation(authorization):
+    user = await token_user_validation(authorization)
+    if isinstance(user, JSONResponse):
+        return user
+    return user.profile()
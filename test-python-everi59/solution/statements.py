@@ -0,0 +1,76 @@
+import re
+import time
+from contextlib import contextmanager
+
+from .config import load_statements_configs
+
+PLACEHOLDER = re.compile(r'%\((\w+)\)s|%s|%%')
+
+statements_settings = load_statements_configs()
+observers = []
+_statements = {}
+
+
+def to_server_placeholders(sql: str) -> tuple[str, list | int]:
+    names = []
+    positional = 0
+
+    def replace(match):
+        nonlocal positional
+        if match.group(0) == '%%':
+            return '%'
+        if match.group(1) is None:
+            positional += 1
+            return f'${positional}'
+        if match.group(1) not in names:
+            names.append(match.group(1))
+        return f'${names.index(match.group(1)) + 1}'
+
+    return PLACEHOLDER.sub(replace, sql.strip().rstrip(';')), names or positional
+
+
+@contextmanager
+def observed(name: str, sql: str):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - started
+        for observer in observers:
+            observer(name, sql, elapsed)
+
+
+def execute(cur, name: str, sql: str, params=None):
+    if observers:
+        with observed(name, sql):
+            _execute(cur, name, sql, params)
+    else:
+        _execute(cur, name, sql, params)
+
+
+async def execute_async(cur, name: str, sql: str, params=None):
+    if observers:
+        with observed(name, sql):
+            await cur.execute(sql, params)
+    else:
+        await cur.execute(sql, params)
+
+
+def _execute(cur, name: str, sql: str, params=None):
+    prepared = getattr(cur.connection, 'prepared', None)
+    if prepared is None or not statements_settings['prepared']:
+        cur.execute(sql, params)
+        return
+    statement = _statements.get(name)
+    if statement is None:
+        statement = _statements[name] = to_server_placeholders(sql)
+    server_sql, names = statement
+    if name not in prepared:
+        cur.execute(f'PREPARE {name} AS {server_sql}')
+        prepared.add(name)
+    if isinstance(names, list):
+        params = [params[key] for key in names]
+    if params:
+        cur.execute(f'EXECUTE {name} ({", ".join(["%s"] * len(params))})', params)
+    else:
+        cur.execute(f'EXECUTE {name}')
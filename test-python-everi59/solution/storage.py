@@ -0,0 +1,129 @@
+import json
+from typing import Protocol
+
+from starlette.concurrency import run_in_threadpool
+
+from .config import load_storage_configs, load_tags_configs
+from .memory import MemoryStorage, load_seed_countries
+from .models import UserRecord
+from .profiler import profiled
+
+
+class Storage(Protocol):
+    async def init_database(self) -> dict: ...
+
+    async def close_database(self): ...
+
+    def pool_stats(self) -> dict | None: ...
+
+    async def get_countries(self) -> list: ...
+
+    async def check_user(self, login, email, phone) -> str | None: ...
+
+    async def register_user(self, login, email, hashed_password, countryCode, isPublic, phone, image): ...
+
+    async def get_user_from_db(self, login: str) -> UserRecord | None: ...
+
+    async def update_user_profile(self, login, **kwargs): ...
+
+    async def update_user_password(self, login, hashed_password): ...
+
+    async def check_user_for_update(self, login, phone) -> str | None: ...
+
+    async def check_friendship(self, friend_from_login, friend_to_login) -> bool: ...
+
+    async def get_visibility(self, viewer, authors) -> dict: ...
+
+    async def get_friends_page(self, friend_from_login, limit, offset=0, after=None) -> tuple[list, tuple | None]: ...
+
+    async def add_friend_to_database(self, friend_from_login, friend_to_login, addedAt): ...
+
+    async def remove_friend_from_database(self, friend_from_login, friend_to_login): ...
+
+    async def insert_new_post(self, post_id: str, content: str, author: str, tags: list, createdAt: str): ...
+
+    async def get_post_from_db(self, post_id: str) -> dict | None: ...
+
+    async def get_feed_page(self, author: str, limit: int, offset=0, after=None) -> tuple[list, tuple | None]: ...
+
+    async def get_home_timeline(self, owner: str, limit: int, after=None) -> tuple[list, tuple | None]: ...
+
+    async def search_posts_by_tag(self, viewer: str, tag: str, limit: int,
+                                  after=None) -> tuple[list, tuple | None]: ...
+
+    async def search_posts_by_text(self, viewer: str, q: str, limit: int, tag=None,
+                                   after=None) -> tuple[list, tuple | None]: ...
+
+    async def get_trending_tags(self, limit: int) -> list: ...
+
+    async def react_to_post(self, post_id, login, reaction) -> dict | None: ...
+
+    async def record_reaction(self, post_id, login, reaction) -> tuple[str | None, dict | None]: ...
+
+    async def apply_counter_deltas(self, deltas: dict): ...
+
+
+class SyncStorage:
+    def __init__(self, storage, offload: bool):
+        self.storage = storage
+        self.offload = offload
+
+    def pool_stats(self) -> dict | None:
+        return self.storage.pool_stats()
+
+    def __getattr__(self, name):
+        func = getattr(self.storage, name)
+        if not callable(func):
+            return func
+
+        async def call(*args, **kwargs):
+            if self.offload:
+                return await run_in_threadpool(profiled(func), *args, **kwargs)
+            return func(*args, **kwargs)
+
+        return call
+
+
+def load_storage(engine: str, memory_countries: str = '') -> Storage:
+    if engine == 'postgres':
+        from . import database
+        return SyncStorage(database, offload=True)
+    if engine == 'postgres-async':
+        from . import async_database
+        return async_database
+    if engine == 'memory':
+        if memory_countries:
+            with open(memory_countries, encoding='utf-8') as f:
+                countries = json.load(f)
+        else:
+            countries = load_seed_countries()
+        return SyncStorage(MemoryStorage(countries, load_tags_configs()['trending_window_hours']), offload=False)
+    raise ValueError(f'Неизвестное хранилище: {engine}')
+
+
+storage = load_storage(**load_storage_configs())
+init_database = storage.init_database
+close_database = storage.close_database
+pool_stats = storage.pool_stats
+get_countries = storage.get_countries
+check_user = storage.check_user
+register_user = storage.register_user
+get_user_from_db = storage.get_user_from_db
+update_user_profile = storage.update_user_profile
+update_user_password = storage.update_user_password
+check_user_for_update = storage.check_user_for_update
+check_friendship = storage.check_friendship
+get_visibility = storage.get_visibility
+get_friends_page = storage.get_friends_page
+add_friend_to_database = storage.add_friend_to_database
+remove_friend_from_database = storage.remove_friend_from_database
+insert_new_post = storage.insert_new_post
+get_post_from_db = storage.get_post_from_db
+get_feed_page = storage.get_feed_page
+get_home_timeline = storage.get_home_timeline
+search_posts_by_tag = storage.search_posts_by_tag
+search_posts_by_text = storage.search_posts_by_text
+get_trending_tags = storage.get_trending_tags
+react_to_post = storage.react_to_post
+record_reaction = storage.record_reaction
+apply_counter_deltas = storage.apply_counter_deltas
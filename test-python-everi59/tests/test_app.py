@@ -1,9 +1,51 @@
+import asyncio
+import functools
+import os
+import subprocess
+import sys
+import threading
+import time
+import uuid
+from datetime import datetime, timezone
+from pathlib import Path
+
+import pytest
 from fastapi.testclient import TestClient
 from ..solution.app import app
 
 client = TestClient(app)
 
 
+def call(func, *args, **kwargs):
+    return client.portal.call(functools.partial(func, *args, **kwargs))
+
+
+@pytest.fixture(scope='module', autouse=True)
+def lifespan():
+    with client:
+        yield
+
+
+def test_import_without_database():
+    root = Path(__file__).resolve().parents[2]
+    module = __package__.rsplit('.', 1)[0] + '.solution.app'
+    env = {**os.environ, 'POSTGRES_HOST': '127.0.0.1', 'POSTGRES_PORT': '1'}
+    result = subprocess.run([sys.executable, '-c', f'import {module}'], cwd=root, env=env,
+                            capture_output=True, text=True, timeout=60)
+    assert result.returncode == 0, result.stderr
+
+
+def test_memory_engine_without_psycopg2():
+    root = Path(__file__).resolve().parents[2]
+    module = __package__.rsplit('.', 1)[0] + '.solution.app'
+    env = {**os.environ, 'STORAGE_ENGINE': 'memory', 'STORAGE_MEMORY_COUNTRIES': ''}
+    code = (f"import sys, {module}; assert 'psycopg2' not in sys.modules, sorted(sys.modules); "
+            f"import asyncio; assert asyncio.run({module}.get_countries())")
+    result = subprocess.run([sys.executable, '-c', code], cwd=root, env=env, capture_output=True, text=True,
+                            timeout=60)
+    assert result.returncode == 0, result.stderr
+
+
 def test_profiles():
     reg_data = {
               "login": "pisunchik",
@@ -213,3 +255,541 @@ def test_profile_friends():
     }
     response = client.post('/api/friends/remove', json=user, headers=headers)
     assert response.status_code == 200
+
+
+def test_countries_etag():
+    response = client.get('/api/countries', params={'region': ['Europe', 'Asia']})
+    assert response.status_code == 200
+    assert [country['alpha2'] for country in response.json()] == sorted(
+        country['alpha2'] for country in response.json()
+    )
+    assert {country['region'] for country in response.json()} == {'Europe', 'Asia'}
+    assert response.headers['Cache-Control'].startswith('public, max-age=')
+    etag = response.headers['ETag']
+
+    response = client.get('/api/countries', params={'region': ['Europe', 'Asia']}, headers={'If-None-Match': etag})
+    assert response.status_code == 304
+    assert response.content == b''
+    assert response.headers['ETag'] == etag
+
+    response = client.get('/api/countries', params={'region': ['Europe']}, headers={'If-None-Match': etag})
+    assert response.status_code == 200
+
+    response = client.get('/api/countries/ru')
+    assert response.status_code == 200
+    assert response.json() == {
+        "name": "Russian Federation",
+        "alpha2": "RU",
+        "alpha3": "RUS",
+        "region": "Europe"
+    }
+    response = client.get('/api/countries/RU', headers={'If-None-Match': response.headers['ETag']})
+    assert response.status_code == 304
+
+    response = client.get('/api/countries/XX')
+    assert response.status_code == 404
+
+
+def test_feed_cursor_pagination():
+    reg_data = {
+        "login": "paginator",
+        "email": "paginator@example.com",
+        "password": "Qwerty1337)",
+        "countryCode": "RU",
+        "isPublic": True,
+        "phone": "+7000000059"
+    }
+    client.post('/api/auth/register', json=reg_data)
+    response = client.post('/api/auth/sign-in', json={"login": "paginator", "password": "Qwerty1337)"})
+    headers = {"Authorization": f"Bearer {response.json()['token']}"}
+
+    created = []
+    for i in range(5):
+        response = client.post('/api/posts/new', json={"content": f"post {i}", "tags": []}, headers=headers)
+        assert response.status_code == 200
+        created.append(response.json()['id'])
+
+    seen = []
+    params = {'limit': 2}
+    while True:
+        response = client.get('/api/posts/feed/my', params=params, headers=headers)
+        assert response.status_code == 200
+        seen.extend(post['post_id'] for post in response.json())
+        if 'X-Next-Cursor' not in response.headers:
+            break
+        params = {'limit': 2, 'cursor': response.headers['X-Next-Cursor']}
+    assert len(seen) == len(set(seen))
+    assert set(created) <= set(seen)
+
+    response = client.get('/api/posts/feed/my', params={'cursor': 'not-a-cursor'}, headers=headers)
+    assert response.status_code == 400
+
+
+def test_concurrent_reactions():
+    from concurrent.futures import ThreadPoolExecutor
+    from ..solution.storage import register_user, insert_new_post, react_to_post, get_post_from_db
+
+    logins = [f'reactor{i}' for i in range(1000)]
+    for i, login in enumerate(logins):
+        call(register_user, login=login, email=f'{login}@example.com', hashed_password='-', countryCode='RU',
+             isPublic=True, phone=f'+71{i:09d}', image=None)
+    post_id = str(uuid.uuid4())
+    call(insert_new_post, post_id=post_id, content='viral', author=logins[0], tags=[], createdAt='2024-01-01T00:00:00Z')
+
+    reactions = [(login, 'like' if i % 2 else 'dislike') for i, login in enumerate(logins)]
+    with ThreadPoolExecutor(max_workers=32) as executor:
+        list(executor.map(lambda args: call(react_to_post, post_id, *args), reactions * 2))
+    post = call(get_post_from_db, post_id=post_id)
+    assert (post['likesCount'], post['dislikesCount']) == (500, 500)
+
+    with ThreadPoolExecutor(max_workers=32) as executor:
+        list(executor.map(lambda login: call(react_to_post, post_id, login, 'like'), logins[:250] * 2))
+    post = call(get_post_from_db, post_id=post_id)
+    assert (post['likesCount'], post['dislikesCount']) == (625, 375)
+
+
+def test_buffered_reaction_counters():
+    from ..solution.counters import CounterBuffer
+    from ..solution.records import reaction_delta
+    from ..solution.storage import register_user, insert_new_post, record_reaction, apply_counter_deltas, \
+        get_post_from_db
+
+    logins = [f'buffered{i}' for i in range(300)]
+    for i, login in enumerate(logins):
+        call(register_user, login=login, email=f'{login}@example.com', hashed_password='-', countryCode='RU',
+             isPublic=True, phone=f'+79{i:09d}', image=None)
+    post_id = str(uuid.uuid4())
+    call(insert_new_post, post_id=post_id, content='buffered', author=logins[0], tags=[],
+         createdAt='2024-01-01T00:00:00Z')
+
+    async def scenario():
+        committed = asyncio.Event()
+
+        async def slow_flusher(deltas):
+            await apply_counter_deltas(deltas)
+            committed.set()
+            await asyncio.sleep(0.2)
+
+        counters = CounterBuffer(slow_flusher, buffered=True, flush_interval=60)
+
+        async def react(login, reaction):
+            async with counters.reading():
+                previous, post = await record_reaction(post_id=post_id, login=login, reaction=reaction)
+                counters.add(post_id, *reaction_delta(previous, reaction))
+
+        async def read():
+            async with counters.reading():
+                post = counters.merge(await get_post_from_db(post_id=post_id))
+            return post['likesCount'], post['dislikesCount']
+
+        reactions = [(login, 'like' if i % 3 else 'dislike') for i, login in enumerate(logins)]
+        await asyncio.gather(*(react(*args) for args in reactions * 2))
+
+        assert (await get_post_from_db(post_id=post_id))['likesCount'] == 0
+        assert await read() == (200, 100)
+
+        flusher = asyncio.create_task(counters.flush())
+        await asyncio.wait_for(committed.wait(), 5)
+        assert await read() == (200, 100)
+        await flusher
+        assert len(counters) == 0
+        assert await read() == (200, 100)
+
+    client.portal.call(scenario)
+
+
+def test_visibility_policy():
+    from ..solution.storage import register_user
+    from ..solution.policy import VisibilityPolicy
+    from ..solution.service import add_friend, remove_friend
+
+    call(register_user, login='private_author', email='private_author@example.com', hashed_password='-',
+         countryCode='RU', isPublic=False, phone='+72000000001', image=None)
+    call(register_user, login='public_author', email='public_author@example.com', hashed_password='-',
+         countryCode='RU', isPublic=True, phone='+72000000002', image=None)
+    call(register_user, login='viewer', email='viewer@example.com', hashed_password='-',
+         countryCode='RU', isPublic=False, phone='+72000000003', image=None)
+
+    policy = VisibilityPolicy('viewer')
+    assert call(policy.can_view_many, ['viewer', 'private_author', 'public_author', 'nobody']) == {
+        'viewer': True, 'private_author': False, 'public_author': True, 'nobody': False
+    }
+
+    call(add_friend, friend_from_login='private_author', friend_to_login='viewer', addedAt='2024-01-01T00:00:00Z')
+    assert call(VisibilityPolicy('viewer').can_view, 'private_author')
+    assert call(VisibilityPolicy('viewer').can_view, 'private_author', is_public=False)
+    call(remove_friend, friend_from_login='private_author', friend_to_login='viewer')
+    assert not call(VisibilityPolicy('viewer').can_view, 'private_author', is_public=False)
+
+
+def test_home_timeline():
+    from ..solution.storage import storage, register_user, insert_new_post
+
+    reg_data = {
+        "login": "timeline-reader",
+        "email": "timeline-reader@example.com",
+        "password": "Qwerty1337)",
+        "countryCode": "RU",
+        "isPublic": False,
+        "phone": "+73000000000"
+    }
+    client.post('/api/auth/register', json=reg_data)
+    response = client.post('/api/auth/sign-in', json={"login": "timeline-reader", "password": "Qwerty1337)"})
+    headers = {"Authorization": f"Bearer {response.json()['token']}"}
+
+    for i, (login, is_public) in enumerate([('regular-author', True), ('celebrity', True), ('hidden-author', False)]):
+        call(register_user, login=login, email=f'{login}@example.com', hashed_password='-', countryCode='RU',
+             isPublic=is_public, phone=f'+7300000000{i + 1}', image=None)
+        assert client.post('/api/friends/add', json={"login": login}, headers=headers).status_code == 200
+
+    def post(author, minute):
+        post_id = str(uuid.uuid4())
+        call(insert_new_post, post_id=post_id, content=f'{author} {minute}', author=author, tags=[],
+             createdAt=f'2024-01-01T00:{minute:02d}:00Z')
+        return post_id
+
+    expected = [post('regular-author', 1)]
+    timeline_settings = getattr(storage, 'timeline_settings', {'fan_out_limit': 0})
+    fan_out_limit = timeline_settings['fan_out_limit']
+    timeline_settings['fan_out_limit'] = 0
+    try:
+        expected.append(post('celebrity', 2))
+    finally:
+        timeline_settings['fan_out_limit'] = fan_out_limit
+    expected.append(post('regular-author', 3))
+    expected.append(post('celebrity', 4))
+    post('hidden-author', 5)
+
+    seen = []
+    params = {'limit': 2}
+    while True:
+        response = client.get('/api/timeline/home', params=params, headers=headers)
+        assert response.status_code == 200
+        seen.extend(item['post_id'] for item in response.json())
+        if 'X-Next-Cursor' not in response.headers:
+            break
+        params = {'limit': 2, 'cursor': response.headers['X-Next-Cursor']}
+    assert seen == expected[::-1]
+
+    client.post('/api/friends/remove', json={"login": "regular-author"}, headers=headers)
+    response = client.get('/api/timeline/home', params={'limit': 10}, headers=headers)
+    assert [item['post_id'] for item in response.json()] == [expected[3], expected[1]]
+
+    call(register_user, login='home', email='home@example.com', hashed_password='-', countryCode='RU',
+         isPublic=True, phone='+73000000009', image=None)
+    home_post = post('home', 6)
+    response = client.get('/api/posts/feed/home', params={'limit': 10}, headers=headers)
+    assert [item['post_id'] for item in response.json()] == [home_post]
+
+
+def test_tag_search_and_trending():
+    reg_data = {
+        "login": "tagger",
+        "email": "tagger@example.com",
+        "password": "Qwerty1337)",
+        "countryCode": "RU",
+        "isPublic": False,
+        "phone": "+74000000000"
+    }
+    client.post('/api/auth/register', json=reg_data)
+    response = client.post('/api/auth/sign-in', json={"login": "tagger", "password": "Qwerty1337)"})
+    headers = {"Authorization": f"Bearer {response.json()['token']}"}
+
+    created = []
+    for tags in (['search-me', 'other'], ['search-me'], ['other'], ['search-me', 'search-me']):
+        response = client.post('/api/posts/new', json={"content": "tagged", "tags": tags}, headers=headers)
+        created.append(response.json()['id'])
+
+    seen = []
+    params = {'tag': 'search-me', 'limit': 2}
+    while True:
+        response = client.get('/api/posts/search', params=params, headers=headers)
+        assert response.status_code == 200
+        seen.extend(post['post_id'] for post in response.json())
+        if 'X-Next-Cursor' not in response.headers:
+            break
+        params = {'tag': 'search-me', 'limit': 2, 'cursor': response.headers['X-Next-Cursor']}
+    assert sorted(seen) == sorted([created[0], created[1], created[3]])
+
+    response = client.get('/api/posts/tags/trending', params={'limit': 2}, headers=headers)
+    assert response.status_code == 200
+    assert response.json()[:2] == [{'tag': 'search-me', 'postsCount': 3}, {'tag': 'other', 'postsCount': 2}]
+
+
+def test_tags_round_trip():
+    reg_data = {
+        "login": "quoter",
+        "email": "quoter@example.com",
+        "password": "Qwerty1337)",
+        "countryCode": "RU",
+        "isPublic": True,
+        "phone": "+75000000000"
+    }
+    client.post('/api/auth/register', json=reg_data)
+    response = client.post('/api/auth/sign-in', json={"login": "quoter", "password": "Qwerty1337)"})
+    headers = {"Authorization": f"Bearer {response.json()['token']}"}
+
+    tags = ['say "hi"', 'a, b', '{braces}', 'back\\slash', "it's", 'NULL', '', 'тег']
+    response = client.post('/api/posts/new', json={"content": "quoted", "tags": tags}, headers=headers)
+    assert response.status_code == 200
+    response = client.get(f"/api/posts/{response.json()['id']}", headers=headers)
+    assert response.json()['tags'] == tags
+    response = client.get('/api/posts/search', params={'tag': 'a, b'}, headers=headers)
+    assert [post['tags'] for post in response.json()] == [tags]
+
+
+def test_full_text_search():
+    reg_data = {
+        "login": "writer",
+        "email": "writer@example.com",
+        "password": "Qwerty1337)",
+        "countryCode": "RU",
+        "isPublic": False,
+        "phone": "+76000000000"
+    }
+    client.post('/api/auth/register', json=reg_data)
+    response = client.post('/api/auth/sign-in', json={"login": "writer", "password": "Qwerty1337)"})
+    headers = {"Authorization": f"Bearer {response.json()['token']}"}
+
+    contents = ['Кошки спят на солнце', 'Кошка и кошки: кошки повсюду', 'Собаки гуляют', 'cats and кошками']
+    created = []
+    for content in contents:
+        response = client.post('/api/posts/new', json={"content": content, "tags": ['pets']}, headers=headers)
+        created.append(response.json()['id'])
+
+    seen = []
+    params = {'q': 'кошка', 'limit': 1}
+    while True:
+        response = client.get('/api/posts/search', params=params, headers=headers)
+        assert response.status_code == 200
+        seen.extend(post['post_id'] for post in response.json())
+        if 'X-Next-Cursor' not in response.headers:
+            break
+        params = {'q': 'кошка', 'limit': 1, 'cursor': response.headers['X-Next-Cursor']}
+    assert seen[0] == created[1]
+    assert sorted(seen) == sorted([created[0], created[1], created[3]])
+
+    response = client.get('/api/posts/search', params={'q': 'собаки', 'tag': 'pets'}, headers=headers)
+    assert [post['post_id'] for post in response.json()] == [created[2]]
+    response = client.get('/api/posts/search', params={'q': 'собаки', 'tag': 'other'}, headers=headers)
+    assert response.json() == []
+    response = client.get('/api/posts/search', headers=headers)
+    assert response.status_code == 400
+
+
+def test_update_password_single_user_fetch(monkeypatch):
+    from ..solution import service, storage
+
+    reg_data = {
+        "login": "rotator",
+        "email": "rotator@example.com",
+        "password": "Qwerty1337)",
+        "countryCode": "RU",
+        "isPublic": True,
+        "phone": "+77000000000"
+    }
+    client.post('/api/auth/register', json=reg_data)
+    response = client.post('/api/auth/sign-in', json={"login": "rotator", "password": "Qwerty1337)"})
+    headers = {"Authorization": f"Bearer {response.json()['token']}"}
+
+    fetched = []
+    get_user_from_db = storage.get_user_from_db
+
+    async def fetch(login):
+        fetched.append(login)
+        return await get_user_from_db(login)
+
+    monkeypatch.setattr(service, 'get_user_from_db', fetch)
+    response = client.post('/api/me/updatePassword', json={"oldPassword": "wrong", "newPassword": "Qwerty1338)"},
+                           headers=headers)
+    assert response.status_code == 403
+    response = client.post('/api/me/updatePassword', json={"oldPassword": "Qwerty1337)", "newPassword": "Qwerty1338)"},
+                           headers=headers)
+    assert response.status_code == 200
+    assert fetched == ['rotator']
+
+    response = client.get('/api/me/profile', headers=headers)
+    assert response.status_code == 401
+    response = client.post('/api/auth/sign-in', json={"login": "rotator", "password": "Qwerty1338)"})
+    assert response.status_code == 200
+
+
+def test_memory_storage():
+    from ..solution.memory import MemoryStorage
+
+    storage = MemoryStorage([{'name': 'Russia', 'alpha2': 'RU', 'alpha3': 'RUS', 'region': 'Europe'}])
+    storage.register_user('author', 'author@example.com', '-', 'RU', False, None, None)
+    storage.register_user('reader', 'reader@example.com', '-', 'RU', True, '+78000000000', None)
+    assert storage.check_user('other', 'reader@example.com', None) == 'email'
+    assert storage.check_user('other', 'other@example.com', None) is None
+
+    post_ids = [str(uuid.uuid4()) for _ in range(5)]
+    for minute, post_id in enumerate(post_ids):
+        storage.insert_new_post(post_id, f'кошки {minute}', 'author', ['pets'], f'2024-01-01T00:{minute:02d}:00Z')
+    page, after = storage.get_feed_page('author', 2)
+    assert [post['post_id'] for post in page] == post_ids[:2:-1]
+    page, after = storage.get_feed_page('author', 2, after=after)
+    assert [post['post_id'] for post in page] == post_ids[2:0:-1]
+    assert [post['post_id'] for post in storage.get_feed_page('author', 2, offset=4)[0]] == post_ids[:1]
+
+    assert storage.search_posts_by_tag('reader', 'pets', 10)[0] == []
+    storage.add_friend_to_database('author', 'reader', '2024-01-01T00:00:00Z')
+    assert storage.get_visibility('reader', ['author', 'nobody']) == {'author': True}
+    assert len(storage.search_posts_by_text('reader', 'кошка', 10, tag='pets')[0]) == 5
+    assert storage.react_to_post(post_ids[0], 'reader', 'like')['likesCount'] == 1
+    assert storage.react_to_post(post_ids[0], 'reader', 'dislike')['dislikesCount'] == 1
+
+
+def test_metrics_render():
+    from ..solution import metrics as app_metrics
+    from ..solution.metrics import Metrics, current_queries
+
+    metrics = Metrics(enabled=True, buckets=[0.01, 0.1])
+    token = current_queries.set([])
+    try:
+        metrics.observe_query('get_user', 'SELECT 1', 0.005)
+        metrics.observe_query('check_friendship', 'SELECT 1', 0.05)
+        queries = current_queries.get()
+    finally:
+        current_queries.reset(token)
+    metrics.observe_request('GET', '/api/profiles/{login_to_get}', 200, 0.08, queries)
+    metrics.observe_hash('verify', 0.2)
+
+    lines = metrics.render().splitlines()
+    assert '# TYPE http_request_duration_seconds histogram' in lines
+    assert 'http_request_duration_seconds_bucket{method="GET",route="/api/profiles/{login_to_get}",le="0.1"} 1' in lines
+    assert 'http_requests_total{method="GET",route="/api/profiles/{login_to_get}",status="200"} 1' in lines
+    assert 'http_request_db_queries_sum{route="/api/profiles/{login_to_get}"} 2.0' in lines
+    assert 'db_query_duration_seconds_bucket{query="get_user",le="0.01"} 1' in lines
+    assert 'db_query_duration_seconds_bucket{query="check_friendship",le="0.01"} 0' in lines
+    assert 'password_hash_duration_seconds_bucket{operation="verify",le="+Inf"} 1' in lines
+    assert not any(line.startswith('db_pool_') for line in lines)
+
+    stats = {'size': 3, 'max_size': 20, 'idle': 1, 'in_use': 2, 'waiting': 0, 'max_in_use': 5, 'saturation': 0.1,
+             'acquired_total': 40, 'waits_total': 2, 'wait_seconds_total': 0.5, 'timeouts_total': 1,
+             'reconnects_total': 0}
+    lines = metrics.render(stats).splitlines()
+    assert '# TYPE db_pool_in_use gauge' in lines
+    assert 'db_pool_in_use 2' in lines
+    assert '# TYPE db_pool_timeouts_total counter' in lines
+    assert 'db_pool_timeouts_total 1' in lines
+    assert client.get('/metrics').status_code == (200 if app_metrics.metrics.enabled else 404)
+
+
+def test_profiler_flags_offenders():
+    from ..solution import profiler as app_profiler
+    from ..solution.profiler import Profiler, current_profile, profiled
+
+    profiler = Profiler(enabled=True, max_queries=3, repeated_queries=2, slow_ms=1000.0, sample_interval=0.0, top=5)
+    profile = profiler.begin()
+    token = current_profile.set(profile)
+    try:
+        for name in ('get_user', 'get_post', 'get_friends', 'get_friends'):
+            profiler.observe_query(name, 'SELECT 1', 0.001)
+    finally:
+        current_profile.reset(token)
+    assert profiler.end(profile, 'POST', '/api/posts/{postId}/like', 200, 0.01) == ['queries', 'n+1']
+    assert profiler.end(profiler.begin(), 'GET', '/api/ping', 200, 0.01) == []
+
+    report = profiler.report()
+    assert [row['route'] for row in report] == ['POST /api/posts/{postId}/like', 'GET /api/ping']
+    assert report[0]['repeated_queries'] == {'get_friends': 1}
+    assert [query['name'] for query in report[0]['last_flagged']['queries']] == \
+        ['get_user', 'get_post', 'get_friends', 'get_friends']
+    assert report[1]['last_flagged'] is None
+
+    profiler = Profiler(enabled=True, max_queries=3, repeated_queries=2, slow_ms=10.0, sample_interval=0.001, top=5)
+    profiler.start()
+    try:
+        profile = profiler.begin()
+        token = current_profile.set(profile)
+        try:
+            threads = profiled(lambda: (time.sleep(0.1), set(profile.threads))[1])()
+        finally:
+            current_profile.reset(token)
+        assert threads == {threading.get_ident()}
+        assert profile.threads == set()
+        assert profiler.end(profile, 'GET', '/api/ping', 200, 0.1) == ['slow']
+    finally:
+        profiler.stop()
+    assert sum(profile.samples.values()) > 0
+
+    async def request():
+        profile = profiler.begin()
+        await asyncio.sleep(0.1)
+        profiler.end(profile, 'GET', '/api/ping', 200, 0.1)
+        return profile
+
+    profiler.start()
+    try:
+        profile = asyncio.run(request())
+    finally:
+        profiler.stop()
+    assert profile.samples['[sleep]'] > 0
+
+    response = client.get('/debug/profiler')
+    if not app_profiler.profiler.enabled:
+        assert response.status_code == 404
+        return
+    offenders = [row for row in response.json()['routes']
+                 if row['last_flagged'] and {'queries', 'n+1'} & set(row['last_flagged']['reasons'])]
+    assert offenders == []
+
+
+def test_password_hash_rounds():
+    from passlib.registry import get_crypt_handler
+    from ..solution.config import load_password_hashing_configs
+    from ..solution.service import make_crypt_context
+
+    if 'PASSWORD_HASH_ROUNDS' not in os.environ and 'PASSWORD_HASH_SCHEME' not in os.environ:
+        assert make_crypt_context(**load_password_hashing_configs()).hash('Qwerty1337').startswith('$5$rounds=10000$')
+    with pytest.raises(ValueError):
+        make_crypt_context(['bcrypt'], 'bcrypt', 10000)
+    handler = get_crypt_handler('pbkdf2_sha256')
+    assert make_crypt_context(['pbkdf2_sha256'], 'pbkdf2_sha256').hash('Qwerty1337').startswith(
+        f'$pbkdf2-sha256${handler.default_rounds}$')
+    context = make_crypt_context(['pbkdf2_sha256'], 'pbkdf2_sha256', 1000)
+    assert context.hash('Qwerty1337').startswith('$pbkdf2-sha256$1000$')
+    assert context.needs_update(make_crypt_context(['pbkdf2_sha256'], 'pbkdf2_sha256', 2000).hash('Qwerty1337'))
+
+
+def test_friend_migrations():
+    psycopg2 = pytest.importorskip('psycopg2')
+    from ..solution.config import load_configs
+    from ..solution.migrations import migrate
+
+    settings = load_configs()
+    conn = psycopg2.connect(host=settings['host'], port=settings['port'], dbname=settings['data'],
+                            user=settings['username'], password=settings['password'],
+                            options='-c search_path=test_migrations')
+    try:
+        cur = conn.cursor()
+        cur.execute('DROP SCHEMA IF EXISTS test_migrations CASCADE; CREATE SCHEMA test_migrations;')
+        migrate(conn, target=1)
+        cur.execute("""INSERT INTO UsersDatabase (login) VALUES ('a'), ('b');""")
+        cur.execute("""INSERT INTO FriendsDatabase VALUES ('a', 'b', '2024-01-02T00:00:00Z'),
+                       ('a', 'b', '2024-03-01T00:00:00Z'), ('a', 'b', NULL);""")
+        conn.commit()
+        migrate(conn, target=2)
+        cur.execute("""SELECT addedAt FROM FriendsDatabase;""")
+        assert cur.fetchall() == [(datetime(2024, 3, 1, tzinfo=timezone.utc),)]
+        migrate(conn, target=5, fan_out_limit=0)
+        cur.execute("""SELECT login FROM UsersDatabase WHERE fanOutOnRead;""")
+        assert cur.fetchall() == [('b',)]
+    finally:
+        conn.rollback()
+        conn.cursor().execute('DROP SCHEMA IF EXISTS test_migrations CASCADE;')
+        conn.commit()
+        conn.close()
+
+
+def test_cache_skips_write_after_invalidation():
+    from ..solution.cache import LRUCache
+
+    cache = LRUCache(maxsize=10, ttl=60)
+    generation = cache.generation('user')
+    cache.invalidate_group('user')
+    cache.set('token', 'stale', group='user', generation=generation)
+    assert cache.get('token') is None
+    cache.set('token', 'fresh', group='user', generation=cache.generation('user'))
+    assert cache.get('token') == 'fresh'